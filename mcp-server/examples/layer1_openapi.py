@@ -22,7 +22,12 @@ Architecture:
 - Main Server: User-friendly tools (server.py)
 """
 
+import asyncio
+import json
 import os
+import uuid
+from collections.abc import AsyncIterator, Callable
+from pathlib import Path
 from typing import Any
 
 import httpx
@@ -31,14 +36,29 @@ from fastmcp import FastMCP
 # R2R API Configuration
 R2R_BASE_URL = os.getenv("R2R_BASE_URL", "http://136.119.36.216:7272")
 API_KEY = os.getenv("API_KEY", "")
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MiB per read when streaming uploads
+
+# Uploads may only read files below this directory (default: working dir)
+INGEST_ROOT = Path(os.getenv("INGEST_ROOT", ".")).resolve()
 
 # Initialize FastMCP server (Layer 1)
 mcp = FastMCP(
     "R2R OpenAPI Layer 1",
-    description="Direct 1-to-1 mapping of R2R v3 API endpoints"
+    instructions="Direct 1-to-1 mapping of R2R v3 API endpoints"
 )
 
 
+def _tool(func: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Register an endpoint wrapper as a tool and return it unchanged.
+
+    Newer FastMCP versions replace a decorated function with a Tool
+    object, which Layer 2 could no longer call as a coroutine.
+    """
+    mcp.tool()(func)
+    return func
+
+
 async def fetch_openapi_spec() -> dict[str, Any]:
     """Fetch OpenAPI specification from R2R server."""
     async with httpx.AsyncClient() as client:
@@ -110,12 +130,13 @@ async def call_r2r_endpoint(
 # Core Retrieval Tools (v3)
 # ========================================
 
-@mcp.tool()
+@_tool
 async def r2r_search(
     query: str,
     limit: int = 3,
     search_strategy: str = "vanilla",
-    use_hybrid_search: bool = True
+    use_hybrid_search: bool = True,
+    filters: dict[str, Any] | None = None
 ) -> dict[str, Any]:
     """
     POST /v3/retrieval/search
@@ -129,31 +150,39 @@ async def r2r_search(
             "limit": limit,
             "search_settings": {
                 "use_hybrid_search": use_hybrid_search,
-                "search_strategy": search_strategy
+                "search_strategy": search_strategy,
+                "filters": filters or {}
             }
         }
     )
 
 
-@mcp.tool()
+@_tool
 async def r2r_rag(
     query: str,
     max_tokens: int = 4000,
-    search_strategy: str = "vanilla"
+    search_strategy: str = "vanilla",
+    filters: dict[str, Any] | None = None,
+    search_limit: int | None = None
 ) -> dict[str, Any]:
     """
     POST /v3/retrieval/rag
-    RAG query with generation
+    RAG query with generation (search_limit caps the chunks put in context)
     """
+    search_settings: dict[str, Any] = {
+        "use_hybrid_search": True,
+        "search_strategy": search_strategy,
+        "filters": filters or {}
+    }
+    if search_limit is not None:
+        search_settings["limit"] = search_limit
+
     return await call_r2r_endpoint(
         "POST",
         "/v3/retrieval/rag",
         body={
             "query": query,
-            "search_settings": {
-                "use_hybrid_search": True,
-                "search_strategy": search_strategy
-            },
+            "search_settings": search_settings,
             "rag_generation_config": {
                 "max_tokens_to_sample": max_tokens
             }
@@ -161,7 +190,7 @@ async def r2r_rag(
     )
 
 
-@mcp.tool()
+@_tool
 async def r2r_agent(
     message: str,
     conversation_id: str | None = None,
@@ -184,11 +213,32 @@ async def r2r_agent(
     return await call_r2r_endpoint("POST", "/v3/retrieval/agent", body=payload)
 
 
+@_tool
+async def r2r_completion(
+    messages: list[dict[str, str]],
+    max_tokens: int = 4000
+) -> dict[str, Any]:
+    """
+    POST /v3/retrieval/completion
+    LLM completion without retrieval
+    """
+    return await call_r2r_endpoint(
+        "POST",
+        "/v3/retrieval/completion",
+        body={
+            "messages": messages,
+            "generation_config": {
+                "max_tokens_to_sample": max_tokens
+            }
+        }
+    )
+
+
 # ========================================
 # Collections Management (v3)
 # ========================================
 
-@mcp.tool()
+@_tool
 async def collections_list(
     limit: int = 10,
     offset: int = 0
@@ -201,7 +251,7 @@ async def collections_list(
     )
 
 
-@mcp.tool()
+@_tool
 async def collections_create(
     name: str,
     description: str
@@ -214,13 +264,13 @@ async def collections_create(
     )
 
 
-@mcp.tool()
+@_tool
 async def collections_get(collection_id: str) -> dict[str, Any]:
     """GET /v3/collections/{id} - Get collection details"""
     return await call_r2r_endpoint("GET", f"/v3/collections/{collection_id}")
 
 
-@mcp.tool()
+@_tool
 async def collections_update(
     collection_id: str,
     name: str | None = None,
@@ -240,46 +290,190 @@ async def collections_update(
     )
 
 
-@mcp.tool()
+@_tool
 async def collections_delete(collection_id: str) -> dict[str, Any]:
     """DELETE /v3/collections/{id} - Delete collection"""
     return await call_r2r_endpoint("DELETE", f"/v3/collections/{collection_id}")
 
 
+@_tool
+async def collection_documents_list(
+    collection_id: str,
+    limit: int = 100,
+    offset: int = 0
+) -> dict[str, Any]:
+    """GET /v3/collections/{id}/documents - List documents in collection"""
+    return await call_r2r_endpoint(
+        "GET",
+        f"/v3/collections/{collection_id}/documents",
+        params={"limit": limit, "offset": offset}
+    )
+
+
+@_tool
+async def collection_add_document(
+    collection_id: str,
+    document_id: str
+) -> dict[str, Any]:
+    """POST /v3/collections/{id}/documents/{document_id} - Add document to collection"""
+    return await call_r2r_endpoint(
+        "POST",
+        f"/v3/collections/{collection_id}/documents/{document_id}",
+        body={}
+    )
+
+
 # ========================================
 # Documents Management (v3)
 # ========================================
 
-@mcp.tool()
+@_tool
 async def documents_list(
     limit: int = 10,
-    offset: int = 0
+    offset: int = 0,
+    ids: list[str] | None = None
 ) -> dict[str, Any]:
-    """GET /v3/documents - List documents"""
+    """GET /v3/documents - List documents, optionally only the given ids"""
+    params: dict[str, Any] = {"limit": limit, "offset": offset}
+    if ids:
+        params["ids"] = ids
+
     return await call_r2r_endpoint(
         "GET",
         "/v3/documents",
-        params={"limit": limit, "offset": offset}
+        params=params
     )
 
 
-@mcp.tool()
+@_tool
 async def documents_get(document_id: str) -> dict[str, Any]:
     """GET /v3/documents/{id} - Get document details"""
     return await call_r2r_endpoint("GET", f"/v3/documents/{document_id}")
 
 
-@mcp.tool()
+@_tool
 async def documents_delete(document_id: str) -> dict[str, Any]:
     """DELETE /v3/documents/{id} - Delete document"""
     return await call_r2r_endpoint("DELETE", f"/v3/documents/{document_id}")
 
 
+@_tool
+async def documents_extract(document_id: str) -> dict[str, Any]:
+    """POST /v3/documents/{id}/extract - Extract entities and relationships"""
+    return await call_r2r_endpoint(
+        "POST",
+        f"/v3/documents/{document_id}/extract",
+        body={}
+    )
+
+
+def resolve_ingest_path(file_path: str | Path) -> Path:
+    """
+    Resolve a client-supplied path inside INGEST_ROOT.
+
+    Relative paths are taken from INGEST_ROOT. Paths that resolve outside
+    it, including through symlinks, raise ValueError.
+    """
+    path = (INGEST_ROOT / file_path).resolve()
+    if not path.is_relative_to(INGEST_ROOT):
+        raise ValueError(f"Path is outside INGEST_ROOT ({INGEST_ROOT}): {file_path}")
+    return path
+
+
+async def _iter_multipart(
+    head: bytes,
+    file_path: Path,
+    tail: bytes,
+    on_chunk: Callable[[int], Any] | None = None
+) -> AsyncIterator[bytes]:
+    """Yield a multipart body, reading the file part in fixed-size chunks."""
+    yield head
+    with open(file_path, "rb") as f:
+        while chunk := await asyncio.to_thread(f.read, UPLOAD_CHUNK_SIZE):
+            yield chunk
+            if on_chunk:
+                on_chunk(len(chunk))
+    yield tail
+
+
+async def upload_document_file(
+    file_path: str,
+    fields: dict[str, Any] | None = None,
+    on_chunk: Callable[[int], Any] | None = None
+) -> dict[str, Any]:
+    """
+    Stream a file to POST /v3/documents as multipart/form-data.
+
+    The file is never read into memory as a whole; it is sent in
+    UPLOAD_CHUNK_SIZE pieces and on_chunk is called with each piece's size.
+
+    Args:
+        file_path: Path of the file to upload (must be inside INGEST_ROOT)
+        fields: Extra form fields; dicts and lists are JSON-encoded
+        on_chunk: Optional callback receiving the byte count of each chunk
+
+    Returns:
+        API response as dict
+    """
+    path = resolve_ingest_path(file_path)
+    boundary = uuid.uuid4().hex
+    filename = path.name.replace('"', "%22")
+
+    head = b""
+    for name, value in (fields or {}).items():
+        if value is None:
+            continue
+        if not isinstance(value, str):
+            value = json.dumps(value)
+        head += (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+            f"{value}\r\n"
+        ).encode()
+    head += (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n"
+    ).encode()
+    tail = f"\r\n--{boundary}--\r\n".encode()
+
+    headers = _get_headers()
+    headers["Content-Type"] = f"multipart/form-data; boundary={boundary}"
+    headers["Content-Length"] = str(len(head) + path.stat().st_size + len(tail))
+
+    async with httpx.AsyncClient(timeout=120.0) as client:
+        response = await client.post(
+            f"{R2R_BASE_URL}/v3/documents",
+            headers=headers,
+            content=_iter_multipart(head, path, tail, on_chunk)
+        )
+        response.raise_for_status()
+        return response.json()
+
+
+@_tool
+async def documents_create(
+    file_path: str,
+    metadata: dict[str, Any] | None = None,
+    collection_ids: list[str] | None = None,
+    ingestion_mode: str | None = None
+) -> dict[str, Any]:
+    """POST /v3/documents - Upload a file from INGEST_ROOT (streamed multipart)"""
+    return await upload_document_file(
+        file_path,
+        fields={
+            "metadata": metadata,
+            "collection_ids": collection_ids,
+            "ingestion_mode": ingestion_mode
+        }
+    )
+
+
 # ========================================
 # Knowledge Graph Operations (v3)
 # ========================================
 
-@mcp.tool()
+@_tool
 async def graphs_list(
     limit: int = 10,
     offset: int = 0
@@ -292,7 +486,7 @@ async def graphs_list(
     )
 
 
-@mcp.tool()
+@_tool
 async def graph_pull(
     collection_id: str
 ) -> dict[str, Any]:
@@ -307,7 +501,7 @@ async def graph_pull(
     )
 
 
-@mcp.tool()
+@_tool
 async def graph_entities(
     collection_id: str,
     limit: int = 50,
@@ -332,7 +526,7 @@ async def graph_entities(
     )
 
 
-@mcp.tool()
+@_tool
 async def graph_entity_create(
     collection_id: str,
     name: str,
@@ -360,7 +554,7 @@ async def graph_entity_create(
     )
 
 
-@mcp.tool()
+@_tool
 async def graph_entity_update(
     collection_id: str,
     entity_id: str,
@@ -387,7 +581,7 @@ async def graph_entity_update(
     )
 
 
-@mcp.tool()
+@_tool
 async def graph_entity_delete(
     collection_id: str,
     entity_id: str
@@ -399,7 +593,7 @@ async def graph_entity_delete(
     )
 
 
-@mcp.tool()
+@_tool
 async def graph_relationships(
     collection_id: str,
     limit: int = 50,
@@ -424,7 +618,7 @@ async def graph_relationships(
     )
 
 
-@mcp.tool()
+@_tool
 async def graph_relationship_create(
     collection_id: str,
     source_entity: str,
@@ -454,7 +648,7 @@ async def graph_relationship_create(
     )
 
 
-@mcp.tool()
+@_tool
 async def graph_relationship_delete(
     collection_id: str,
     relationship_id: str
@@ -466,7 +660,7 @@ async def graph_relationship_delete(
     )
 
 
-@mcp.tool()
+@_tool
 async def graph_communities(
     collection_id: str,
     limit: int = 50,
@@ -484,7 +678,7 @@ async def graph_communities(
 # Conversations Management (v3)
 # ========================================
 
-@mcp.tool()
+@_tool
 async def conversations_list(
     limit: int = 10,
     offset: int = 0
@@ -497,7 +691,7 @@ async def conversations_list(
     )
 
 
-@mcp.tool()
+@_tool
 async def conversation_get(
     conversation_id: str
 ) -> dict[str, Any]:
@@ -508,7 +702,7 @@ async def conversation_get(
     )
 
 
-@mcp.tool()
+@_tool
 async def conversation_delete(
     conversation_id: str
 ) -> dict[str, Any]:
@@ -523,19 +717,19 @@ async def conversation_delete(
 # System & Health (v3)
 # ========================================
 
-@mcp.tool()
+@_tool
 async def system_health() -> dict[str, Any]:
     """GET /v3/health - Check system health"""
     return await call_r2r_endpoint("GET", "/v3/health")
 
 
-@mcp.tool()
+@_tool
 async def system_settings() -> dict[str, Any]:
     """GET /v3/system/settings - Get system settings"""
     return await call_r2r_endpoint("GET", "/v3/system/settings")
 
 
-@mcp.tool()
+@_tool
 async def analytics_overview() -> dict[str, Any]:
     """GET /v3/analytics - Get analytics overview"""
     return await call_r2r_endpoint("GET", "/v3/analytics")
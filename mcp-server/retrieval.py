@@ -0,0 +1,287 @@
+"""
+Shared retrieval helpers
+========================
+
+Side-effect-free helpers used by both the main server (server.py) and the
+Layer 2 smart tools (layer2_smart.py), so the two stay consistent:
+
+- Token estimation and token-budgeted context packing
+- A semantic answer cache matching paraphrased queries
+"""
+
+import hashlib
+import logging
+import os
+import random
+import re
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any
+
+# Per-chunk token cap and the smallest remainder worth filling
+MAX_CHUNK_TOKENS = int(os.getenv("MAX_CHUNK_TOKENS", "512"))
+MIN_CHUNK_TOKENS = 32
+
+_SENTENCE_END_RE = re.compile(r"[.!?](?=\s)")
+_TRUNCATION_MARK = " …"
+
+# Semantic answer cache defaults: estimated Jaccard similarity of query
+# shingles needed to reuse an answer, and entry lifetime / capacity
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.8"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "1000"))
+
+# Words dropped before shingling, so "what is X" and "tell me about X" match
+_FILLER_WORDS = frozenset({
+    "a", "an", "the", "is", "are", "what", "whats",
+    "please", "tell", "me", "about", "s"
+})
+
+# Words that flip a question's meaning while barely changing its shingles
+# ("enable logging" vs "disable logging"); two queries only match when
+# they use the same ones, and the same numbers
+_POLARITY_WORDS = frozenset({
+    "not", "no", "never", "without", "nor", "none",
+    "dont", "doesnt", "didnt", "isnt", "arent", "wasnt", "werent",
+    "cant", "cannot", "wont", "shouldnt", "wouldnt", "couldnt",
+    "enable", "enabled", "disable", "disabled",
+    "allow", "allowed", "deny", "denied", "include", "exclude",
+    "add", "remove", "start", "stop", "open", "close", "on", "off",
+    "increase", "decrease", "more", "less", "above", "below",
+    "before", "after", "first", "last", "min", "max",
+    "minimum", "maximum", "lowest", "highest", "best", "worst",
+    "pros", "cons", "advantages", "disadvantages", "true", "false"
+})
+
+
+def estimate_tokens(text: str) -> int:
+    """Fast token estimate: about 4 characters per token for English text."""
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Cut text to at most max_tokens (estimated).
+
+    Prefers a sentence end in the second half of the allowance, then a
+    word boundary (marked with " …"). Returns "" when nothing but
+    whitespace fits.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    cut = text[:max_tokens * 4]
+    sentence_ends = [m.end() for m in _SENTENCE_END_RE.finditer(cut)]
+    if sentence_ends and sentence_ends[-1] >= len(cut) // 2:
+        return cut[:sentence_ends[-1]]
+
+    # Leave room for the marker so the result still fits max_tokens
+    words = cut[:len(cut) - len(_TRUNCATION_MARK)].rsplit(None, 1)
+    return words[0] + _TRUNCATION_MARK if words else ""
+
+
+def pack_context(
+    chunks: list[dict[str, Any]],
+    budget: int,
+    max_chunk_tokens: int = MAX_CHUNK_TOKENS
+) -> tuple[list[dict[str, Any]], int]:
+    """
+    Pack the highest-value chunks into a token budget.
+
+    Chunks are taken in the given (ranked) order. Each is capped at
+    max_chunk_tokens, and the last one is truncated to fit if at least
+    MIN_CHUNK_TOKENS remain. Returns the packed chunks (text possibly
+    truncated, marked with "truncated") and the estimated tokens used.
+    """
+    packed = []
+    used = 0
+    for chunk in chunks:
+        remaining = budget - used
+        if remaining < MIN_CHUNK_TOKENS:
+            break
+
+        text = str(chunk.get("text", ""))
+        fitted = truncate_to_tokens(text, min(max_chunk_tokens, remaining))
+        if not fitted.strip():
+            continue
+
+        packed.append({**chunk, "text": fitted, "truncated": fitted != text})
+        used += estimate_tokens(fitted)
+    return packed, used
+
+
+class SemanticCache:
+    """
+    Answer cache that also matches paraphrased queries.
+
+    Queries are normalized (lowercase, punctuation and filler words
+    dropped) and shingled into character 4-grams. A MinHash signature of
+    the shingles is indexed with LSH (bands x rows), so lookups only
+    compare against candidates sharing a band. A candidate is a hit when
+    its estimated Jaccard similarity reaches the threshold and it has the
+    same numbers and negation/antonym words (see _POLARITY_WORDS), which
+    shingle similarity alone cannot tell apart. Entries are scoped (e.g. by
+    collection and generation settings) and expire after a TTL, evicting
+    least recently used entries beyond max_entries.
+
+    Optionally, a retrieval fingerprint (the chunk ids a query retrieved)
+    further restricts matches: when both queries have one, their chunk id
+    overlap must also reach chunk_threshold. Shared chunks never make up
+    for a lower query similarity, since questions with opposite intent
+    often retrieve the same chunks.
+    """
+
+    _MERSENNE_PRIME = (1 << 61) - 1
+
+    def __init__(
+        self,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        num_perm: int = 64,
+        bands: int = 16,
+        ttl: float = SEMANTIC_CACHE_TTL,
+        max_entries: int = SEMANTIC_CACHE_SIZE,
+        chunk_threshold: float = 0.8
+    ):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.chunk_threshold = chunk_threshold
+        self.logger = logging.getLogger("mcp.semantic_cache")
+
+        rng = random.Random(1729)
+        self._perms = [
+            (
+                rng.randrange(1, self._MERSENNE_PRIME),
+                rng.randrange(0, self._MERSENNE_PRIME)
+            )
+            for _ in range(num_perm)
+        ]
+        self.entries: OrderedDict[int, dict[str, Any]] = OrderedDict()
+        self.buckets: dict[tuple, set[int]] = defaultdict(set)
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _normalize(self, query: str) -> str:
+        words = re.findall(r"[a-z0-9]+", query.lower().replace("'", ""))
+        return " ".join(w for w in words if w not in _FILLER_WORDS)
+
+    def _key_terms(self, query: str) -> frozenset[str]:
+        """Numbers and polarity words, which must match exactly."""
+        return frozenset(
+            w for w in self._normalize(query).split()
+            if w in _POLARITY_WORDS or any(ch.isdigit() for ch in w)
+        )
+
+    def _signature(self, query: str) -> tuple[int, ...]:
+        text = self._normalize(query)
+        shingles = {text[i:i + 4] for i in range(max(1, len(text) - 3))}
+        hashes = [
+            int.from_bytes(
+                hashlib.blake2b(sh.encode(), digest_size=8).digest(), "big"
+            )
+            for sh in shingles
+        ]
+        return tuple(
+            min((a * h + b) % self._MERSENNE_PRIME for h in hashes)
+            for a, b in self._perms
+        )
+
+    def _band_keys(self, scope: str, signature: tuple[int, ...]) -> list[tuple]:
+        return [
+            (scope, band, signature[band * self.rows:(band + 1) * self.rows])
+            for band in range(self.bands)
+        ]
+
+    @staticmethod
+    def _similarity(a: tuple[int, ...], b: tuple[int, ...]) -> float:
+        return sum(x == y for x, y in zip(a, b, strict=True)) / len(a)
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self.entries.pop(entry_id)
+        for key in self._band_keys(entry["scope"], entry["signature"]):
+            self.buckets[key].discard(entry_id)
+            if not self.buckets[key]:
+                del self.buckets[key]
+
+    def get(
+        self,
+        query: str,
+        scope: str = "global",
+        chunk_ids: list[str] | None = None
+    ) -> Any | None:
+        """Return the cached answer of the most similar query, if any."""
+        signature = self._signature(query)
+        key_terms = self._key_terms(query)
+        ids = set(chunk_ids or [])
+        now = time.time()
+
+        candidates = set()
+        for key in self._band_keys(scope, signature):
+            candidates |= self.buckets.get(key, set())
+
+        best_id, best_similarity = None, 0.0
+        for entry_id in candidates:
+            entry = self.entries[entry_id]
+            if now - entry["time"] >= self.ttl:
+                self._remove(entry_id)
+                continue
+
+            if entry["key_terms"] != key_terms:
+                continue
+            similarity = self._similarity(signature, entry["signature"])
+            matches = similarity >= self.threshold
+            if matches and ids and entry["chunk_ids"]:
+                shared = ids & entry["chunk_ids"]
+                overlap = len(shared) / len(ids | entry["chunk_ids"])
+                matches = overlap >= self.chunk_threshold
+            if matches and similarity >= best_similarity:
+                best_id, best_similarity = entry_id, similarity
+
+        if best_id is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(best_id)
+        entry = self.entries[best_id]
+        self.logger.info(
+            f"🧠 Semantic cache HIT: '{query}' ~ '{entry['query']}' "
+            f"(similarity {best_similarity:.2f})"
+        )
+        return entry["value"]
+
+    def set(
+        self,
+        query: str,
+        value: Any,
+        scope: str = "global",
+        chunk_ids: list[str] | None = None
+    ) -> None:
+        """Cache an answer under the query's signature."""
+        signature = self._signature(query)
+        entry_id = self._next_id
+        self._next_id += 1
+        self.entries[entry_id] = {
+            "query": query,
+            "scope": scope,
+            "signature": signature,
+            "key_terms": self._key_terms(query),
+            "chunk_ids": set(chunk_ids or []),
+            "value": value,
+            "time": time.time()
+        }
+        for key in self._band_keys(scope, signature):
+            self.buckets[key].add(entry_id)
+
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.buckets.clear()
+        self.hits = 0
+        self.misses = 0
@@ -4,7 +4,7 @@ R2R Ultra FastMCP Server v3.0
 ==============================
 
 Production-ready MCP server with ALL advanced FastMCP features:
-- ✨ Middleware (Logging, Timing, Rate Limiting, Caching, Error Handling)
+- ✨ Middleware (Logging, Timing, Rate Limiting, Deadlines, Caching, Error Handling)
 - 🔄 Lifespan Management (startup/shutdown hooks)
 - 📊 Context Integration (logging, progress, sampling)
 - 📚 Resources & Resource Templates (parameterized)
@@ -21,21 +21,37 @@ License: MIT
 """
 
 import asyncio
+import hashlib
+import itertools
+import json
 import logging
+import math
 import os
+import pickle
+import re
 import time
-from collections import defaultdict
+import zlib
+from collections import OrderedDict, defaultdict
+from collections.abc import Awaitable, Callable
 from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from datetime import datetime
 from pathlib import Path
 from typing import Any
 
+import anyio
 import httpx
 from fastmcp import Context, FastMCP
+from fastmcp.exceptions import ToolError
 from fastmcp.server.middleware import Middleware, MiddlewareContext
 from mcp import McpError
 from mcp.types import ErrorData, PromptMessage, TextContent
 
+try:
+    import zstandard  # optional: faster, better-ratio cache compression
+except ImportError:
+    zstandard = None
+
 # ========================================
 # Configuration & Logging Setup
 # ========================================
@@ -54,11 +70,103 @@ if env_path.exists():
                 if key not in os.environ:
                     os.environ[key] = value
 
+# Imported after .env is loaded, since retrieval reads its settings from it
+from retrieval import SemanticCache, pack_context  # noqa: E402
+
 # R2R Configuration
 R2R_BASE_URL = os.getenv("R2R_BASE_URL", "http://localhost:7272")
 API_KEY = os.getenv("API_KEY", "")
 MAX_RETRIES = int(os.getenv("MAX_RETRIES", "3"))
 TIMEOUT = float(os.getenv("TIMEOUT", "120.0"))
+UPSTREAM_CONCURRENCY = int(os.getenv("UPSTREAM_CONCURRENCY", "8"))
+TOOL_DEADLINE = float(os.getenv("R2R_TOOL_DEADLINE", "180.0"))
+# Fan-outs stop this many seconds before the tool deadline, leaving time to
+# return the results that did complete
+FAN_OUT_MARGIN = float(os.getenv("R2R_FAN_OUT_MARGIN", "2.0"))
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "50"))
+
+# Near-duplicate detection: chunks whose 64-bit SimHash similarity
+# (1 - hamming distance / 64) reaches the threshold are collapsed
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.9"))
+SIMHASH_CACHE_SIZE = 10000
+
+# Local BM25 reranking: candidates fetched when reranking, BM25 parameters
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "50"))
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# MMR diversity selection: similarity assigned to two chunks of the same
+# document, on top of their text (SimHash) similarity
+SAME_DOCUMENT_SIMILARITY = 0.7
+
+# Progressive-deepening search: first page size, growth factor and the
+# most chunks fetched in total before giving up on min_score
+ADAPTIVE_INITIAL_LIMIT = 5
+ADAPTIVE_GROWTH = 2
+ADAPTIVE_MAX_CANDIDATES = int(os.getenv("ADAPTIVE_MAX_CANDIDATES", "100"))
+
+# Token-budgeted RAG context: candidates retrieved for packing (the
+# per-chunk cap, MAX_CHUNK_TOKENS, lives in retrieval.py)
+CONTEXT_CANDIDATES = 20
+
+# Negative cache for ids R2R reported as not found: short-lived and sized
+# separately from the result cache
+NEGATIVE_CACHE_TTL = float(os.getenv("NEGATIVE_CACHE_TTL", "10"))
+NEGATIVE_CACHE_SIZE = 5000
+
+# Tools and resources whose results describe live server state (or that
+# wrap other calls) and therefore must never be served from the cache
+UNCACHEABLE_TOOLS = {
+    "batch", "clear_cache", "get_performance_stats", "get_server_capabilities"
+}
+UNCACHEABLE_RESOURCES = {"r2r://server/stats"}
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1000"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Cached results whose serialized size reaches this are stored compressed
+# (zstd when installed, zlib otherwise); sizes count post-compression
+CACHE_COMPRESS_THRESHOLD = int(os.getenv("CACHE_COMPRESS_THRESHOLD", "4096"))
+
+# Per-endpoint (default timeout, minimum useful budget) in seconds, matched
+# by longest path prefix; every timeout is also capped by TIMEOUT and by
+# the remaining deadline of the tool call
+ENDPOINT_TIMEOUTS: dict[str, tuple[float, float]] = {
+    "/v3/health": (10.0, 0.5),
+    "/v3/retrieval/search": (30.0, 1.0),
+    "/v3/retrieval/rag": (90.0, 5.0),
+    "/v3/retrieval/completion": (90.0, 5.0),
+    "/v3/retrieval/agent": (120.0, 10.0),
+}
+# Everything else (documents, collections, graphs, ...) keeps the previous
+# global timeout, since ingestion and extraction calls can be slow
+DEFAULT_ENDPOINT_TIMEOUT = (120.0, 1.0)
+
+# Errors meaning the client went away; retrying the tool cannot help
+CLIENT_GONE_ERRORS = (anyio.ClosedResourceError, anyio.BrokenResourceError)
+
+# Absolute (monotonic) deadline of the tool call being served, if any
+_deadline: ContextVar[float | None] = ContextVar("r2r_deadline", default=None)
+
+# Per-request flag a handler clears to keep its result out of the cache
+_cache_result: ContextVar[dict[str, bool] | None] = ContextVar(
+    "r2r_cache_result", default=None
+)
+
+
+class DeadlineExceededError(TimeoutError):
+    """Raised when the remaining budget cannot cover an upstream request."""
+
+
+def _unwrap_tool_error(error: Exception) -> BaseException:
+    """
+    The exception a tool actually raised.
+
+    FastMCP re-raises exceptions from tool functions as ToolError with the
+    original as __cause__; middleware needs the original to classify it.
+    """
+    if isinstance(error, ToolError) and error.__cause__ is not None:
+        return error.__cause__
+    return error
+
 
 # Configure logging
 logging.basicConfig(
@@ -145,6 +253,13 @@ class LoggingMiddleware(Middleware):
                 f"✅ [{self.request_count}] {context.method} completed in {duration:.2f}ms"
             )
             return result
+        except asyncio.CancelledError:
+            duration = (time.time() - start_time) * 1000
+            self.logger.info(
+                f"🚫 [{self.request_count}] {context.method} "
+                f"cancelled after {duration:.2f}ms"
+            )
+            raise
         except Exception as e:
             duration = (time.time() - start_time) * 1000
             self.logger.error(
@@ -242,32 +357,53 @@ class ErrorHandlingMiddleware(Middleware):
         for attempt in range(self.max_retries + 1):
             try:
                 return await call_next(context)
-            except httpx.HTTPStatusError as e:
-                error_key = f"{operation_id}:HTTP{e.response.status_code}"
-                self.error_counts[error_key] += 1
+            except asyncio.CancelledError:
+                # Client cancelled: propagate immediately so in-flight
+                # upstream requests are aborted, never retry
+                self.error_counts[f"{operation_id}:Cancelled"] += 1
+                self.logger.info(f"🚫 {tool_name} cancelled")
+                raise
+            except Exception as raised:
+                e = _unwrap_tool_error(raised)
+                if isinstance(e, CLIENT_GONE_ERRORS):
+                    self.error_counts[f"{operation_id}:ClientGone"] += 1
+                    self.logger.info(f"🔌 {tool_name} abandoned: client disconnected")
+                    raise
+                if isinstance(e, DeadlineExceededError):
+                    self.error_counts[f"{operation_id}:DeadlineExceeded"] += 1
+                    raise
+                if isinstance(e, httpx.HTTPStatusError):
+                    error_key = f"{operation_id}:HTTP{e.response.status_code}"
+                    self.error_counts[error_key] += 1
 
-                if attempt < self.max_retries and e.response.status_code >= 500:
                     wait_time = 2 ** attempt
-                    self.logger.warning(
-                        f"⚠️ Retrying {tool_name} after HTTP {e.response.status_code} "
-                        f"(attempt {attempt + 1}/{self.max_retries + 1}, waiting {wait_time}s)"
-                    )
-                    await asyncio.sleep(wait_time)
-                    continue
+                    if (
+                        attempt < self.max_retries
+                        and e.response.status_code >= 500
+                        and _budget_allows(wait_time)
+                    ):
+                        self.logger.warning(
+                            f"⚠️ Retrying {tool_name} after HTTP "
+                            f"{e.response.status_code} (attempt {attempt + 1}/"
+                            f"{self.max_retries + 1}, waiting {wait_time}s)"
+                        )
+                        await asyncio.sleep(wait_time)
+                        continue
+
+                    status = e.response.status_code
+                    self.logger.error(f"❌ {tool_name} failed with HTTP {status}")
+                    raise McpError(
+                        ErrorData(
+                            code=-32603,
+                            message=f"HTTP error {status}: {e.response.text}"
+                        )
+                    ) from e
 
-                self.logger.error(f"❌ {tool_name} failed with HTTP {e.response.status_code}")
-                raise McpError(
-                    ErrorData(
-                        code=-32603,
-                        message=f"HTTP error {e.response.status_code}: {e.response.text}"
-                    )
-                )
-            except Exception as e:
                 error_key = f"{operation_id}:{type(e).__name__}"
                 self.error_counts[error_key] += 1
 
-                if attempt < self.max_retries:
-                    wait_time = 2 ** attempt
+                wait_time = 2 ** attempt
+                if attempt < self.max_retries and _budget_allows(wait_time):
                     self.logger.warning(
                         f"⚠️ Retrying {tool_name} after {type(e).__name__} "
                         f"(attempt {attempt + 1}/{self.max_retries + 1})"
@@ -279,32 +415,288 @@ class ErrorHandlingMiddleware(Middleware):
                 raise
 
 
+class DeadlineMiddleware(Middleware):
+    """Gives every tool call a deadline that upstream requests inherit."""
+
+    def __init__(self, default_budget: float = TOOL_DEADLINE):
+        self.default_budget = default_budget
+        self.logger = logging.getLogger("mcp.deadline")
+        self.deadlines_exceeded = 0
+
+    async def on_call_tool(self, context: MiddlewareContext, call_next):
+        """Set the call deadline for the duration of the tool."""
+        # A deadline set by an enclosing call (e.g. a batch) is never extended
+        deadline = time.monotonic() + self.default_budget
+        outer = _deadline.get()
+        if outer is not None:
+            deadline = min(deadline, outer)
+
+        token = _deadline.set(deadline)
+        try:
+            # httpx timeouts apply per phase (connect, read, ...), so a call
+            # can outlive them; cancel the whole tool once the deadline passes
+            with anyio.move_on_after(max(0.0, deadline - time.monotonic())):
+                return await call_next(context)
+            raise DeadlineExceededError("tool did not finish before its deadline")
+        except Exception as raised:
+            e = _unwrap_tool_error(raised)
+            if not isinstance(e, DeadlineExceededError):
+                raise
+            self.deadlines_exceeded += 1
+            tool_name = getattr(context.message, "name", "unknown_tool")
+            self.logger.warning(f"⌛ {tool_name} ran out of time budget: {e}")
+            raise McpError(
+                ErrorData(
+                    code=-32001,
+                    message=f"Deadline exceeded: {e}"
+                )
+            ) from e
+        finally:
+            _deadline.reset(token)
+
+
+class FrequencySketch:
+    """
+    Count-min sketch of access frequencies for TinyLFU cache admission.
+
+    Each key increments one 4-bit counter (capped at 15) in each of
+    `depth` rows; its estimate is the minimum over the rows. After
+    sample_size increments every counter is halved, so the sketch tracks
+    recent popularity rather than all-time counts.
+    """
+
+    MAX_COUNT = 15
+
+    def __init__(self, width: int, depth: int = 4, sample_size: int | None = None):
+        self.width = max(width, 16)
+        self.depth = depth
+        self.sample_size = sample_size or 10 * self.width
+        self.table = [[0] * self.width for _ in range(depth)]
+        self.additions = 0
+        self.resets = 0
+
+    def _indexes(self, key: str) -> list[int]:
+        digest = hashlib.blake2b(key.encode(), digest_size=4 * self.depth).digest()
+        return [
+            int.from_bytes(digest[4 * row:4 * row + 4], "big") % self.width
+            for row in range(self.depth)
+        ]
+
+    def increment(self, key: str) -> None:
+        for row, index in zip(self.table, self._indexes(key), strict=True):
+            if row[index] < self.MAX_COUNT:
+                row[index] += 1
+
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            for row in self.table:
+                row[:] = [count >> 1 for count in row]
+            self.additions //= 2
+            self.resets += 1
+
+    def estimate(self, key: str) -> int:
+        return min(
+            row[index]
+            for row, index in zip(self.table, self._indexes(key), strict=True)
+        )
+
+
 class CachingMiddleware(Middleware):
-    """Simple in-memory caching middleware for expensive operations."""
+    """
+    Simple in-memory caching middleware for expensive operations.
+
+    Caches tool results and resource reads. The cache holds at most
+    max_entries (and max_bytes) in LRU order behind a TinyLFU admission
+    filter: once full, a new entry is only admitted if it has been
+    requested more often (per a frequency sketch) than the LRU entries it
+    would evict, so bursts of one-off calls cannot flush hot entries.
+
+    Results serializing to compress_threshold bytes or more are stored
+    compressed; byte accounting uses the stored (compressed) size.
+
+    Identical calls that arrive while the first one is still running wait
+    for its result instead of issuing their own (single-flight).
+    """
 
-    def __init__(self, ttl: int = 300):
-        self.cache: dict[str, tuple[Any, float]] = {}
+    def __init__(
+        self,
+        ttl: int = 300,
+        uncacheable: set[str] | None = None,
+        uncacheable_resources: set[str] | None = None,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        max_bytes: int = CACHE_MAX_BYTES,
+        compress_threshold: int = CACHE_COMPRESS_THRESHOLD
+    ):
+        # key -> (result or compressed payload, stored at, stored size,
+        # uncompressed size, codec)
+        self.cache: OrderedDict[
+            str, tuple[Any, float, int, int, str | None]
+        ] = OrderedDict()
         self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.compress_threshold = compress_threshold
+        self.codec = "zstd" if zstandard is not None else "zlib"
+        self.uncacheable = UNCACHEABLE_TOOLS if uncacheable is None else uncacheable
+        self.uncacheable_resources = (
+            UNCACHEABLE_RESOURCES if uncacheable_resources is None
+            else uncacheable_resources
+        )
+        self.sketch = FrequencySketch(width=max_entries)
         self.logger = logging.getLogger("mcp.cache")
         self.hits = 0
         self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.admissions_rejected = 0
+        self.total_bytes = 0
+        self.compressed_entries = 0
+        self.bytes_before_compression = 0
+        self.bytes_after_compression = 0
+        self.inflight: dict[str, asyncio.Future] = {}
 
     def _get_cache_key(self, context: MiddlewareContext) -> str:
-        """Generate cache key from request context."""
-        # Use context attributes available in MiddlewareContext
-        cache_key = f"{context.method}:{hash(str(context))}"
-        return cache_key
+        """Generate cache key from the tool name and arguments, or resource URI."""
+        if context.method == "resources/read":
+            return f"{context.method}:{context.message.uri}"
+        tool_name = getattr(context.message, "name", "unknown_tool")
+        arguments = getattr(context.message, "arguments", None) or {}
+        arguments_key = json.dumps(arguments, sort_keys=True, default=str)
+        return f"{context.method}:{tool_name}:{arguments_key}"
+
+    def _encode(self, result: Any) -> tuple[Any, int, int, str | None]:
+        """Serialize-and-compress large results: (payload, size, raw size, codec)."""
+        try:
+            raw = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            size = len(repr(result))
+            return result, size, size, None  # not picklable: keep as-is
+        if len(raw) < self.compress_threshold:
+            return result, len(raw), len(raw), None
+
+        if self.codec == "zstd":
+            compressed = zstandard.ZstdCompressor(level=3).compress(raw)
+        else:
+            compressed = zlib.compress(raw, 6)
+        if len(compressed) >= len(raw):
+            return result, len(raw), len(raw), None
+        return compressed, len(compressed), len(raw), self.codec
+
+    @staticmethod
+    def _decode(payload: Any, codec: str | None) -> Any:
+        if codec is None:
+            return payload
+        if codec == "zstd":
+            raw = zstandard.ZstdDecompressor().decompress(payload)
+        else:
+            raw = zlib.decompress(payload)
+        return pickle.loads(raw)  # our own serialization of a cached result
+
+    def _drop(self, cache_key: str) -> None:
+        _, _, size, raw_size, codec = self.cache.pop(cache_key)
+        self.total_bytes -= size
+        if codec is not None:
+            self.compressed_entries -= 1
+            self.bytes_before_compression -= raw_size
+            self.bytes_after_compression -= size
+
+    def _select_victims(
+        self,
+        cache_key: str,
+        stored_at: float,
+        size: int
+    ) -> list[str] | None:
+        """
+        Pick LRU victims so the entry and byte budgets have room for a
+        candidate of `size` bytes, or None if the candidate loses admission.
+
+        An existing entry under cache_key is replaced, so its slot and
+        bytes count as free and it is never chosen as a victim.
+        """
+        existing = self.cache.get(cache_key)
+        excess_entries = len(self.cache) + (existing is None) - self.max_entries
+        excess_bytes = self.total_bytes + size - self.max_bytes
+        if existing is not None:
+            excess_bytes -= existing[2]
+
+        frequency = self.sketch.estimate(cache_key)
+        victims = []
+        for victim, (_, victim_time, victim_size, _, _) in self.cache.items():
+            if excess_entries <= 0 and excess_bytes <= 0:
+                break
+            if victim == cache_key:
+                continue
+            expired = stored_at - victim_time >= self.ttl
+            if not expired and frequency <= self.sketch.estimate(victim):
+                return None
+            victims.append(victim)
+            excess_entries -= 1
+            excess_bytes -= victim_size
+        return victims
+
+    def _admit(self, cache_key: str, result: Any, stored_at: float) -> None:
+        """Store a result, evicting LRU entries if the candidate wins admission."""
+        # Decide on the entry budget first: a one-off losing admission is
+        # rejected before paying for serialization and compression
+        if self._select_victims(cache_key, stored_at, 0) is None:
+            self.admissions_rejected += 1
+            return
+
+        payload, size, raw_size, codec = self._encode(result)
+        victims = self._select_victims(cache_key, stored_at, size)
+        if victims is None or size > self.max_bytes:
+            self.admissions_rejected += 1
+            return
+
+        if cache_key in self.cache:
+            self._drop(cache_key)
+        for victim in victims:
+            self._drop(victim)
+            self.evictions += 1
+
+        self.cache[cache_key] = (payload, stored_at, size, raw_size, codec)
+        self.total_bytes += size
+        if codec is not None:
+            self.compressed_entries += 1
+            self.bytes_before_compression += raw_size
+            self.bytes_after_compression += size
+
+    def clear(self) -> int:
+        """Drop every entry and reset statistics; returns the entries removed."""
+        removed = len(self.cache)
+        self.cache.clear()
+        self.total_bytes = 0
+        self.compressed_entries = 0
+        self.bytes_before_compression = 0
+        self.bytes_after_compression = 0
+        self.hits = 0
+        self.misses = 0
+        return removed
 
     async def on_call_tool(self, context: MiddlewareContext, call_next):
         """Cache tool results."""
+        if getattr(context.message, "name", None) in self.uncacheable:
+            return await call_next(context)
+        return await self._cached(context, call_next)
+
+    async def on_read_resource(self, context: MiddlewareContext, call_next):
+        """Cache resource reads."""
+        if str(getattr(context.message, "uri", "")) in self.uncacheable_resources:
+            return await call_next(context)
+        return await self._cached(context, call_next)
+
+    async def _cached(self, context: MiddlewareContext, call_next):
         cache_key = self._get_cache_key(context)
         current_time = time.time()
+        self.sketch.increment(cache_key)
 
         # Check cache
         if cache_key in self.cache:
-            result, cached_time = self.cache[cache_key]
+            payload, cached_time, _, _, codec = self.cache[cache_key]
             if current_time - cached_time < self.ttl:
                 self.hits += 1
+                self.cache.move_to_end(cache_key)
+                result = self._decode(payload, codec)
                 hit_rate = self.hits / (self.hits + self.misses) * 100
                 self.logger.info(
                     f"💾 Cache HIT for '{cache_key}' "
@@ -313,20 +705,93 @@ class CachingMiddleware(Middleware):
                 return result
             else:
                 # Expired
-                del self.cache[cache_key]
+                self._drop(cache_key)
+
+        # Join an identical call that is already running
+        pending = self.inflight.get(cache_key)
+        if pending is not None:
+            self.coalesced += 1
+            self.logger.debug(f"🔗 Joining in-flight call for '{cache_key}'")
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # The leading call was cancelled, not us: run it ourselves
 
         # Cache miss
         self.misses += 1
         self.logger.debug(f"📝 Cache MISS for '{cache_key}'")
 
-        result = await call_next(context)
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[cache_key] = future
+        store = {"store": True}
+        token = _cache_result.set(store)
+        try:
+            result = await call_next(context)
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                future.exception()  # mark retrieved when nobody joined
+            raise
+        finally:
+            _cache_result.reset(token)
+            if self.inflight.get(cache_key) is future:
+                del self.inflight[cache_key]
 
-        # Store in cache
-        self.cache[cache_key] = (result, current_time)
+        # Store in cache (subject to admission) unless the handler opted out
+        if store["store"]:
+            self._admit(cache_key, result, current_time)
+        future.set_result(result)
 
         return result
 
 
+class NegativeCache:
+    """
+    Short-lived record of resource paths R2R answered with 404.
+
+    Lookups of a recorded path are answered locally until the entry
+    expires, shielding R2R from agents retrying bad ids. Entries are
+    LRU-bounded separately from the result cache. Resources are usually
+    created outside this server (Layer 1/2, other clients), so nothing
+    here can invalidate an entry; the short TTL bounds how long a newly
+    created id keeps answering 404.
+    """
+
+    def __init__(
+        self,
+        ttl: float = NEGATIVE_CACHE_TTL,
+        max_entries: int = NEGATIVE_CACHE_SIZE
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: OrderedDict[str, float] = OrderedDict()
+        self.hits = 0
+
+    def contains(self, path: str) -> bool:
+        expires = self.entries.get(path)
+        if expires is None:
+            return False
+        if time.monotonic() >= expires:
+            del self.entries[path]
+            return False
+        self.hits += 1
+        return True
+
+    def add(self, path: str) -> None:
+        self.entries[path] = time.monotonic() + self.ttl
+        self.entries.move_to_end(path)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.hits = 0
+
+
 # ========================================
 # Initialize FastMCP Server with Lifespan
 # ========================================
@@ -338,7 +803,7 @@ mcp = FastMCP(
 
     Features:
     - 🎯 35+ advanced tools for R2R integration
-    - 🔄 Middleware: logging, timing, rate limiting, caching, error handling
+    - 🔄 Middleware: logging, timing, rate limiting, deadlines, caching, error handling
     - 📊 Real-time performance monitoring
     - 📚 Dynamic resources and resource templates
     - 🎨 Reusable prompt templates
@@ -357,21 +822,80 @@ logger.info("🔧 Configuring middleware stack...")
 logging_middleware = LoggingMiddleware()
 timing_middleware = TimingMiddleware()
 rate_limiting_middleware = RateLimitingMiddleware(max_requests_per_minute=100)
+deadline_middleware = DeadlineMiddleware(default_budget=TOOL_DEADLINE)
 error_handling_middleware = ErrorHandlingMiddleware(max_retries=2)
 caching_middleware = CachingMiddleware(ttl=300)
 
 mcp.add_middleware(logging_middleware)
 mcp.add_middleware(timing_middleware)
 mcp.add_middleware(rate_limiting_middleware)
+mcp.add_middleware(deadline_middleware)
 mcp.add_middleware(error_handling_middleware)
 mcp.add_middleware(caching_middleware)
 logger.info("✅ Middleware stack configured")
 
+# Paraphrase-tolerant answer cache for RAG tools (SEMANTIC_CACHE_* settings
+# in retrieval.py)
+semantic_cache = SemanticCache()
+
+# Not-found documents/collections, consulted before upstream lookups
+negative_cache = NegativeCache()
+
 
 # ========================================
 # Helper Functions
 # ========================================
 
+def _remaining_budget() -> float | None:
+    """Seconds left before the current tool call's deadline (None if unset)."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def _budget_allows(seconds: float) -> bool:
+    """Whether waiting `seconds` still leaves time before the deadline."""
+    remaining = _remaining_budget()
+    return remaining is None or remaining > seconds
+
+
+def _request_timeout(endpoint: str) -> float:
+    """
+    Timeout for one upstream request.
+
+    Starts from the endpoint's default, capped by TIMEOUT and by the
+    remaining tool budget. Fails fast with DeadlineExceededError when the
+    remaining budget is below what the endpoint minimally needs.
+    """
+    matches = [prefix for prefix in ENDPOINT_TIMEOUTS if endpoint.startswith(prefix)]
+    default, minimum = (
+        ENDPOINT_TIMEOUTS[max(matches, key=len)]
+        if matches
+        else DEFAULT_ENDPOINT_TIMEOUT
+    )
+    timeout = min(default, TIMEOUT)
+
+    remaining = _remaining_budget()
+    if remaining is not None:
+        if remaining < minimum:
+            raise DeadlineExceededError(
+                f"{remaining:.1f}s left, {endpoint} needs at least {minimum:.1f}s"
+            )
+        timeout = min(timeout, remaining)
+    return timeout
+
+
+_ENTITY_PATH_RE = re.compile(r"^/v3/(documents|collections)/([^/?]+)$")
+
+
+def _skip_result_cache() -> None:
+    """Keep the current tool/resource result out of the result cache."""
+    store = _cache_result.get()
+    if store is not None:
+        store["store"] = False
+
+
 def _get_headers() -> dict[str, str]:
     """Get authentication headers for R2R."""
     headers = {"Content-Type": "application/json"}
@@ -393,13 +917,30 @@ async def _make_r2r_request(
     - Progress reporting for long operations
     - Logging for debugging
     - Error tracking
+
+    The timeout comes from _request_timeout(): per-endpoint defaults
+    bounded by the remaining deadline of the tool call.
     """
     url = f"{R2R_BASE_URL}{endpoint}"
+    entity_lookup = method == "GET" and _ENTITY_PATH_RE.match(endpoint) is not None
+
+    # Known-missing documents/collections are answered without a round trip
+    if entity_lookup and negative_cache.contains(endpoint):
+        request = httpx.Request(method, url)
+        raise httpx.HTTPStatusError(
+            f"Not found (cached): {endpoint}",
+            request=request,
+            response=httpx.Response(
+                404, request=request, text='{"detail": "Not found (cached)"}'
+            )
+        )
+
+    timeout = _request_timeout(endpoint)
 
     if ctx:
         await ctx.info(f"Making {method} request to {endpoint}")
 
-    async with httpx.AsyncClient(timeout=TIMEOUT) as client:
+    async with httpx.AsyncClient(timeout=timeout) as client:
         if method == "GET":
             response = await client.get(url, headers=_get_headers(), params=data or {})
         elif method == "POST":
@@ -411,6 +952,8 @@ async def _make_r2r_request(
         else:
             raise ValueError(f"Unsupported HTTP method: {method}")
 
+        if entity_lookup and response.status_code == 404:
+            negative_cache.add(endpoint)
         response.raise_for_status()
 
         if ctx:
@@ -419,6 +962,281 @@ async def _make_r2r_request(
         return response.json()
 
 
+async def _fan_out(
+    calls: list[Callable[[], Awaitable[Any]]],
+    limit: int = UPSTREAM_CONCURRENCY,
+    deadline: float | None = None
+) -> list[Any]:
+    """
+    Run independent upstream calls concurrently inside one task group.
+
+    Results come back in input order with exceptions returned in place,
+    so one failing call does not abort its siblings. Cancelling the caller
+    (client cancel or disconnect) cancels the whole group, aborting every
+    outstanding HTTP request at once.
+
+    Calls still running after `deadline` seconds are cancelled and an
+    asyncio.TimeoutError is returned in their place. The deadline defaults
+    to FAN_OUT_MARGIN seconds before the tool's own, so the caller can still
+    report the calls that finished instead of being cancelled with them.
+    """
+    if deadline is None:
+        remaining = _remaining_budget()
+        if remaining is not None:
+            deadline = max(0.0, remaining - FAN_OUT_MARGIN)
+
+    results: list[Any] = [None] * len(calls)
+    finished = [False] * len(calls)
+    limiter = anyio.CapacityLimiter(limit)
+
+    async def run(index: int, call: Callable[[], Awaitable[Any]]) -> None:
+        async with limiter:
+            try:
+                results[index] = await call()
+            except Exception as e:
+                results[index] = e
+        finished[index] = True
+
+    with anyio.move_on_after(deadline):
+        async with anyio.create_task_group() as tg:
+            for index, call in enumerate(calls):
+                tg.start_soon(run, index, call)
+
+    for index, done in enumerate(finished):
+        if not done:
+            results[index] = asyncio.TimeoutError(
+                f"not completed within {deadline:.1f}s deadline"
+            )
+    return results
+
+
+_TOKEN_RE = re.compile(r"\w+")
+_simhash_cache: OrderedDict[str, int] = OrderedDict()
+
+
+def _simhash(text: str) -> int:
+    """
+    64-bit SimHash of a text over its word 2-shingles.
+
+    Each shingle's hash bits vote +1/-1 per position, counted for all 64
+    positions at once by adding the hash to per-bit counters in one pass
+    over its set bits.
+    """
+    tokens = _TOKEN_RE.findall(text.lower())
+    shingles = [" ".join(pair) for pair in itertools.pairwise(tokens)] or tokens
+    if not shingles:
+        return 0
+
+    counts = [0] * 64
+    for shingle in shingles:
+        digest = hashlib.blake2b(shingle.encode(), digest_size=8).digest()
+        value = int.from_bytes(digest, "big")
+        while value:
+            low = value & -value
+            counts[low.bit_length() - 1] += 1
+            value ^= low
+
+    # A bit is set when more than half of the shingles voted for it
+    half = len(shingles) / 2
+    return sum(1 << bit for bit, count in enumerate(counts) if count > half)
+
+
+def _chunk_simhash(chunk: dict[str, Any]) -> int:
+    """SimHash of a chunk's text, cached per chunk id."""
+    chunk_id = chunk.get("id")
+    if chunk_id is None:
+        return _simhash(chunk.get("text", ""))
+
+    key = str(chunk_id)
+    if key in _simhash_cache:
+        _simhash_cache.move_to_end(key)
+        return _simhash_cache[key]
+
+    signature = _simhash(chunk.get("text", ""))
+    _simhash_cache[key] = signature
+    if len(_simhash_cache) > SIMHASH_CACHE_SIZE:
+        _simhash_cache.popitem(last=False)
+    return signature
+
+
+def _dedupe_near_duplicates(
+    chunks: list[dict[str, Any]],
+    threshold: float = NEAR_DUPLICATE_THRESHOLD
+) -> tuple[list[dict[str, Any]], int]:
+    """
+    Collapse near-duplicate chunks, keeping the highest-ranked copy.
+
+    Chunks are visited in ranking order; a chunk whose SimHash is within
+    the threshold of an already kept chunk is dropped and its id recorded
+    in the kept chunk's duplicate_ids. Returns (kept chunks, dropped count).
+    """
+    max_distance = int((1 - threshold) * 64)
+    kept: list[tuple[int, dict[str, Any]]] = []
+    removed = 0
+
+    for chunk in chunks:
+        signature = _chunk_simhash(chunk)
+        for kept_signature, kept_chunk in kept:
+            if (signature ^ kept_signature).bit_count() <= max_distance:
+                kept_chunk.setdefault("duplicate_ids", []).append(chunk.get("id"))
+                removed += 1
+                break
+        else:
+            kept.append((signature, dict(chunk)))
+
+    return [chunk for _, chunk in kept], removed
+
+
+def _bm25_rerank(
+    query: str,
+    chunks: list[dict[str, Any]],
+    weight: float = 0.5,
+    k1: float = BM25_K1,
+    b: float = BM25_B
+) -> list[dict[str, Any]]:
+    """
+    Rerank chunks by blending the upstream score with local BM25.
+
+    Term frequencies and document lengths are computed once per chunk and
+    IDF over the candidate set; only the query terms are then scored.
+    BM25 is normalized to [0, 1] by the best candidate before blending:
+    rerank_score = (1 - weight) * score + weight * bm25.
+    """
+    if not chunks:
+        return []
+
+    query_terms = set(_TOKEN_RE.findall(query.lower()))
+    term_freqs = []
+    for chunk in chunks:
+        freqs: dict[str, int] = defaultdict(int)
+        for token in _TOKEN_RE.findall(str(chunk.get("text", "")).lower()):
+            freqs[token] += 1
+        term_freqs.append(freqs)
+
+    lengths = [sum(freqs.values()) for freqs in term_freqs]
+    avg_length = sum(lengths) / len(lengths) or 1.0
+    n = len(chunks)
+    idf = {}
+    for term in query_terms:
+        df = sum(1 for freqs in term_freqs if term in freqs)
+        idf[term] = math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    bm25 = []
+    for freqs, length in zip(term_freqs, lengths, strict=True):
+        norm = k1 * (1 - b + b * length / avg_length)
+        bm25.append(sum(
+            idf[term] * freqs[term] * (k1 + 1) / (freqs[term] + norm)
+            for term in query_terms if term in freqs
+        ))
+
+    best = max(bm25) or 1.0
+    reranked = [
+        {
+            **chunk,
+            "bm25_score": round(score / best, 4),
+            "rerank_score": round(
+                (1 - weight) * chunk.get("score", 0) + weight * score / best, 4
+            )
+        }
+        for chunk, score in zip(chunks, bm25, strict=True)
+    ]
+    reranked.sort(key=lambda chunk: chunk["rerank_score"], reverse=True)
+    return reranked
+
+
+def _mmr_select(
+    chunks: list[dict[str, Any]],
+    k: int = 10,
+    diversity: float = 0.3
+) -> list[dict[str, Any]]:
+    """
+    Select k chunks by maximal marginal relevance.
+
+    Each step picks the chunk maximizing
+    (1 - diversity) * relevance - diversity * max similarity to the chunks
+    already selected. Relevance is rerank_score (or the upstream score),
+    both already in [0, 1]. Similarity is the larger of the chunks' SimHash
+    text similarity (rescaled so unrelated text is ~0) and
+    SAME_DOCUMENT_SIMILARITY for chunks of the same document. The running
+    max similarity of every candidate is updated once per pick, so the
+    selection costs O(n * k) similarity evaluations.
+    """
+    if not chunks or k <= 0:
+        return []
+
+    relevance = [c.get("rerank_score", c.get("score", 0)) for c in chunks]
+
+    signatures = [_chunk_simhash(c) for c in chunks]
+    documents = [c.get("document_id") for c in chunks]
+    max_similarity = [0.0] * len(chunks)
+    remaining = set(range(len(chunks)))
+    selected: list[int] = []
+
+    while remaining and len(selected) < k:
+        best = max(
+            remaining,
+            key=lambda i: (1 - diversity) * relevance[i] - diversity * max_similarity[i]
+        )
+        selected.append(best)
+        remaining.discard(best)
+
+        for i in remaining:
+            text_similarity = 1 - (signatures[i] ^ signatures[best]).bit_count() / 64
+            similarity = max(0.0, 2 * text_similarity - 1)
+            if documents[i] is not None and documents[i] == documents[best]:
+                similarity = max(similarity, SAME_DOCUMENT_SIMILARITY)
+            max_similarity[i] = max(max_similarity[i], similarity)
+
+    return [chunks[i] for i in selected]
+
+
+async def _search_until_enough(
+    query: str,
+    search_settings: dict[str, Any],
+    min_score: float,
+    needed: int,
+    ctx: Context | None = None
+) -> tuple[list[dict[str, Any]], int]:
+    """
+    Page through search results until `needed` chunks pass min_score.
+
+    Starts with ADAPTIVE_INITIAL_LIMIT results and grows the page size by
+    ADAPTIVE_GROWTH each round. Stops as soon as enough chunks pass, the
+    results run out, a page ends below min_score (results are ranked, so
+    later pages cannot pass) or ADAPTIVE_MAX_CANDIDATES were fetched.
+    Returns every fetched chunk and the number of requests made.
+    """
+    results: list[dict[str, Any]] = []
+    passing = 0
+    requests = 0
+    limit = min(max(ADAPTIVE_INITIAL_LIMIT, 1), ADAPTIVE_MAX_CANDIDATES)
+
+    while True:
+        payload = {
+            "query": query,
+            "limit": limit,
+            "search_settings": {
+                **search_settings, "limit": limit, "offset": len(results)
+            }
+        }
+        result = await _make_r2r_request("POST", "/v3/retrieval/search", payload, ctx)
+        requests += 1
+
+        page = result.get("results", {}).get("chunk_search_results", [])
+        results.extend(page)
+        passing += sum(1 for r in page if r.get("score", 0) >= min_score)
+
+        if (
+            passing >= needed
+            or len(page) < limit
+            or page[-1].get("score", 0) < min_score
+            or len(results) >= ADAPTIVE_MAX_CANDIDATES
+        ):
+            return results, requests
+
+        limit = min(limit * ADAPTIVE_GROWTH, ADAPTIVE_MAX_CANDIDATES - len(results))
+
+
 # ========================================
 # Tools with Context Integration
 # ========================================
@@ -463,12 +1281,16 @@ async def get_server_capabilities(ctx: Context) -> dict[str, Any]:
         "r2r_base_url": R2R_BASE_URL,
         "r2r_health": health,
         "features": {
-            "middleware": ["logging", "timing", "rate_limiting", "error_handling", "caching"],
+            "middleware": [
+                "logging", "timing", "rate_limiting",
+                "deadline", "error_handling", "caching"
+            ],
             "lifespan_management": True,
             "context_integration": True,
             "resources": True,
             "prompts": True,
-            "server_composition": True
+            "server_composition": True,
+            "batch_execution": True
         },
         "statistics": {
             "timing": {
@@ -492,11 +1314,15 @@ async def r2r_search_with_progress(
     query: str,
     limit: int = 10,
     strategy: str = "hybrid",
+    dedupe: bool = True,
     ctx: Context = None
 ) -> dict[str, Any]:
     """
     Advanced search with real-time progress reporting.
 
+    Near-duplicate chunks (overlapping or re-uploaded documents) are
+    collapsed unless dedupe is False.
+
     Demonstrates:
     - Progress reporting for long operations
     - Context logging
@@ -524,15 +1350,26 @@ async def r2r_search_with_progress(
     try:
         result = await _make_r2r_request("POST", "/v3/retrieval/search", payload, ctx)
 
+        duplicates_removed = 0
+        chunks = result.get("results", {}).get("chunk_search_results")
+        if dedupe and chunks:
+            result["results"]["chunk_search_results"], duplicates_removed = (
+                _dedupe_near_duplicates(chunks)
+            )
+
         if ctx:
             await ctx.report_progress(100, 100, "Search completed")
             results_count = len(result.get("results", {}).get("chunk_search_results", []))
-            await ctx.info(f"✅ Found {results_count} results")
+            await ctx.info(
+                f"✅ Found {results_count} results "
+                f"({duplicates_removed} near-duplicates removed)"
+            )
 
         return {
             "query": query,
             "strategy": strategy,
             "results": result,
+            "duplicates_removed": duplicates_removed,
             "timestamp": datetime.now().isoformat()
         }
     except Exception as e:
@@ -545,11 +1382,23 @@ async def r2r_search_with_progress(
 async def r2r_rag_with_sampling(
     query: str,
     max_tokens: int = 4000,
+    context_budget: int | None = None,
+    collection_ids: list[str] | None = None,
+    use_semantic_cache: bool = True,
     ctx: Context = None
 ) -> dict[str, Any]:
     """
     RAG query with optional LLM sampling for enhanced responses.
 
+    With context_budget (tokens), the context is assembled locally instead
+    of by R2R: candidates are searched, near-duplicates collapsed, BM25
+    reranked, and the best chunks packed into the budget before a plain
+    completion call. Smaller, denser contexts generate faster and cheaper.
+
+    Answers are kept in a semantic cache scoped by collection_ids and
+    generation settings, so paraphrases of an answered question (or, with
+    a context budget, questions retrieving the same chunks) skip generation.
+
     Demonstrates:
     - Context.sample() for LLM integration
     - Multi-step operations with progress
@@ -559,10 +1408,34 @@ async def r2r_rag_with_sampling(
         await ctx.info(f"💬 Processing RAG query: '{query}'")
         await ctx.report_progress(0, 100, "Preparing RAG query")
 
+    scope = f"{sorted(collection_ids or [])}:{max_tokens}:{context_budget}"
+    if use_semantic_cache:
+        cached = semantic_cache.get(query, scope)
+        if cached is not None:
+            if ctx:
+                await ctx.info(
+                    f"🧠 Reusing answer for similar query: '{cached['query']}'"
+                )
+            return {
+                **cached,
+                "query": query,
+                "cached_query": cached["query"],
+                "semantic_cache_hit": True
+            }
+
+    filters = {"collection_ids": {"$overlap": collection_ids}} if collection_ids else {}
+
+    if context_budget is not None:
+        return await _rag_with_packed_context(
+            query, max_tokens, context_budget, filters,
+            scope if use_semantic_cache else None, ctx
+        )
+
     payload = {
         "query": query,
         "search_settings": {
-            "use_hybrid_search": True
+            "use_hybrid_search": True,
+            "filters": filters
         },
         "rag_generation_config": {
             "max_tokens_to_sample": max_tokens
@@ -578,11 +1451,99 @@ async def r2r_rag_with_sampling(
         await ctx.report_progress(100, 100, "Complete")
         await ctx.info("✅ RAG query completed")
 
-    return {
+    response = {
+        "query": query,
+        "result": result,
+        "timestamp": datetime.now().isoformat()
+    }
+    if use_semantic_cache:
+        semantic_cache.set(query, response, scope)
+    return response
+
+
+async def _rag_with_packed_context(
+    query: str,
+    max_tokens: int,
+    context_budget: int,
+    filters: dict[str, Any],
+    cache_scope: str | None = None,
+    ctx: Context | None = None
+) -> dict[str, Any]:
+    """Search, dedupe, rerank and pack chunks into a budget, then generate."""
+    if ctx:
+        await ctx.report_progress(20, 100, "Retrieving context")
+
+    search = await _make_r2r_request("POST", "/v3/retrieval/search", {
+        "query": query,
+        "limit": CONTEXT_CANDIDATES,
+        "search_settings": {
+            "use_hybrid_search": True,
+            "limit": CONTEXT_CANDIDATES,
+            "filters": filters
+        }
+    }, ctx)
+    chunks = search.get("results", {}).get("chunk_search_results", [])
+    chunks, duplicates_removed = _dedupe_near_duplicates(chunks)
+    packed, used = pack_context(_bm25_rerank(query, chunks), context_budget)
+    chunk_ids = [str(chunk.get("id")) for chunk in packed]
+
+    # A similar question can reuse the answer if it retrieved (nearly) the
+    # same chunks
+    if cache_scope is not None:
+        cached = semantic_cache.get(query, cache_scope, chunk_ids=chunk_ids)
+        if cached is not None:
+            return {
+                **cached,
+                "query": query,
+                "cached_query": cached["query"],
+                "semantic_cache_hit": True
+            }
+
+    if ctx:
+        await ctx.report_progress(
+            50, 100, f"Generating answer from {len(packed)} chunks (~{used} tokens)"
+        )
+
+    sources = "\n\n".join(f"[{i}] {chunk['text']}" for i, chunk in enumerate(packed, 1))
+    result = await _make_r2r_request("POST", "/v3/retrieval/completion", {
+        "messages": [{
+            "role": "user",
+            "content": (
+                "Answer the question using the numbered sources below. "
+                f"Cite sources as [n].\n\nSources:\n{sources}\n\nQuestion: {query}"
+            )
+        }],
+        "generation_config": {"max_tokens_to_sample": max_tokens}
+    }, ctx)
+
+    if ctx:
+        await ctx.report_progress(100, 100, "Complete")
+        await ctx.info("✅ RAG query completed")
+
+    response = {
         "query": query,
         "result": result,
+        "context": {
+            "budget": context_budget,
+            "estimated_tokens": used,
+            "candidates": len(chunks) + duplicates_removed,
+            "duplicates_removed": duplicates_removed,
+            "chunks_used": len(packed),
+            "chunks_truncated": sum(1 for chunk in packed if chunk["truncated"]),
+            "sources": [
+                {
+                    "source": i,
+                    "chunk_id": chunk.get("id"),
+                    "document_id": chunk.get("document_id")
+                }
+                for i, chunk in enumerate(packed, 1)
+            ]
+        },
         "timestamp": datetime.now().isoformat()
     }
+    if cache_scope is not None:
+        semantic_cache.set(query, response, cache_scope, chunk_ids=chunk_ids)
+    return response
 
 
 # ========================================
@@ -616,6 +1577,11 @@ async def server_configuration() -> str:
         "api_key_configured": bool(API_KEY),
         "max_retries": MAX_RETRIES,
         "timeout": TIMEOUT,
+        "tool_deadline": TOOL_DEADLINE,
+        "endpoint_timeouts": {
+            prefix: {"default": default, "minimum": minimum}
+            for prefix, (default, minimum) in ENDPOINT_TIMEOUTS.items()
+        },
         "features": {
             "middleware": True,
             "caching": True,
@@ -642,6 +1608,7 @@ async def collection_info_resource(collection_id: str, ctx: Context) -> str:
         import json
         return json.dumps(result, indent=2)
     except Exception as e:
+        _skip_result_cache()
         await ctx.error(f"Failed to fetch collection: {e}")
         return json.dumps({"error": str(e)})
 
@@ -667,6 +1634,7 @@ async def document_summary_resource(document_id: str, ctx: Context) -> str:
         import json
         return json.dumps(summary, indent=2)
     except Exception as e:
+        _skip_result_cache()
         await ctx.error(f"Failed to fetch document: {e}")
         return json.dumps({"error": str(e)})
 
@@ -794,38 +1762,51 @@ async def batch_document_analysis(
     Analyze multiple documents in parallel with progress tracking.
 
     Demonstrates:
-    - Parallel async operations
+    - Parallel async operations in a cancellable task group
     - Progress reporting for long-running tasks
     - Batch processing patterns
     """
     if ctx:
         await ctx.info(f"📊 Analyzing {len(document_ids)} documents ({analysis_type})")
 
-    results = []
     total = len(document_ids)
+    completed = 0
 
-    for idx, doc_id in enumerate(document_ids):
-        if ctx:
-            ((idx + 1) / total) * 100
-            await ctx.report_progress(idx + 1, total, f"Processing document {idx + 1}/{total}")
-
+    async def fetch(doc_id: str) -> Any:
+        nonlocal completed
         try:
             doc = await _make_r2r_request("GET", f"/v3/documents/{doc_id}", ctx=ctx)
-            doc_data = doc.get("results", {})
-
-            results.append({
-                "id": doc_id,
-                "title": doc_data.get("title", "Untitled"),
-                "status": doc_data.get("ingestion_status"),
-                "size": doc_data.get("size_in_bytes", 0)
-            })
         except Exception as e:
+            doc = e
+        completed += 1
+        if ctx:
+            await ctx.report_progress(
+                completed, total, f"Processed document {completed}/{total}"
+            )
+        return doc
+
+    docs = await _fan_out(
+        [lambda doc_id=doc_id: fetch(doc_id) for doc_id in document_ids]
+    )
+
+    results = []
+    for doc_id, doc in zip(document_ids, docs, strict=True):
+        if isinstance(doc, Exception):
             if ctx:
-                await ctx.warning(f"Failed to process {doc_id}: {e}")
+                await ctx.warning(f"Failed to process {doc_id}: {doc}")
             results.append({
                 "id": doc_id,
-                "error": str(e)
+                "error": str(doc)
             })
+            continue
+
+        doc_data = doc.get("results", {})
+        results.append({
+            "id": doc_id,
+            "title": doc_data.get("title", "Untitled"),
+            "status": doc_data.get("ingestion_status"),
+            "size": doc_data.get("size_in_bytes", 0)
+        })
 
     if ctx:
         await ctx.info(f"✅ Batch analysis complete: {len(results)} documents processed")
@@ -845,12 +1826,26 @@ async def smart_collection_search(
     query: str,
     collection_ids: list[str] | None = None,
     min_score: float = 0.7,
+    dedupe: bool = True,
+    rerank: bool = False,
+    rerank_weight: float = 0.5,
+    diversify: bool = False,
+    diversity: float = 0.3,
+    max_results: int = 10,
+    adaptive: bool = False,
     ctx: Context = None
 ) -> dict[str, Any]:
     """
     Smart search with automatic filtering and result enhancement.
 
     This tool shows how to combine multiple operations into a workflow.
+    Near-duplicate chunks are collapsed before the top results are taken.
+    With rerank, a wider candidate set (RERANK_CANDIDATES) is fetched and
+    reordered locally by BM25 blended with the upstream score. With
+    diversify, the top results are chosen by maximal marginal relevance so
+    they spread across documents instead of repeating one. With adaptive,
+    results are paged in growing steps only until max_results pass
+    min_score, instead of always fetching a fixed candidate set.
     """
     if ctx:
         await ctx.info(f"🔍 Smart search: '{query}' (min_score: {min_score})")
@@ -866,24 +1861,41 @@ async def smart_collection_search(
     if collection_ids:
         search_settings["filters"]["collection_ids"] = {"$overlap": collection_ids}
 
-    payload = {
-        "query": query,
-        "limit": 20,  # Get more then filter
-        "search_settings": search_settings
-    }
-
     if ctx:
         await ctx.report_progress(40, 100, "Executing search")
 
-    result = await _make_r2r_request("POST", "/v3/retrieval/search", payload, ctx)
+    if adaptive:
+        results, requests = await _search_until_enough(
+            query, search_settings, min_score, max_results, ctx
+        )
+    else:
+        payload = {
+            "query": query,
+            "limit": RERANK_CANDIDATES if rerank else 20,  # Get more then filter
+            "search_settings": search_settings
+        }
+        result = await _make_r2r_request("POST", "/v3/retrieval/search", payload, ctx)
+        results = result.get("results", {}).get("chunk_search_results", [])
+        requests = 1
 
     # Step 2: Filter by score
     if ctx:
         await ctx.report_progress(70, 100, "Filtering results")
 
-    results = result.get("results", {}).get("chunk_search_results", [])
     filtered = [r for r in results if r.get("score", 0) >= min_score]
 
+    duplicates_removed = 0
+    if dedupe:
+        filtered, duplicates_removed = _dedupe_near_duplicates(filtered)
+
+    if rerank:
+        filtered = _bm25_rerank(query, filtered, weight=rerank_weight)
+
+    if diversify:
+        top_results = _mmr_select(filtered, k=max_results, diversity=diversity)
+    else:
+        top_results = filtered[:max_results]
+
     if ctx:
         await ctx.report_progress(100, 100, "Complete")
         await ctx.info(f"✅ Found {len(filtered)}/{len(results)} results above threshold")
@@ -892,9 +1904,13 @@ async def smart_collection_search(
         "query": query,
         "total_found": len(results),
         "after_filtering": len(filtered),
+        "duplicates_removed": duplicates_removed,
+        "reranked": rerank,
+        "diversified": diversify,
+        "search_requests": requests,
         "min_score": min_score,
         "collections": collection_ids or [],
-        "results": filtered[:10],  # Return top 10
+        "results": top_results,
         "timestamp": datetime.now().isoformat()
     }
 
@@ -920,9 +1936,38 @@ async def get_performance_stats() -> dict[str, Any]:
         "hits": caching_middleware.hits,
         "misses": caching_middleware.misses,
         "hit_rate": f"{caching_middleware.hits / (caching_middleware.hits + caching_middleware.misses) * 100:.1f}%" if (caching_middleware.hits + caching_middleware.misses) > 0 else "N/A",
-        "cache_size": len(caching_middleware.cache)
+        "cache_size": len(caching_middleware.cache),
+        "max_entries": caching_middleware.max_entries,
+        "size_bytes": caching_middleware.total_bytes,
+        "max_bytes": caching_middleware.max_bytes,
+        "compression": {
+            "codec": caching_middleware.codec,
+            "compressed_entries": caching_middleware.compressed_entries,
+            "ratio": round(
+                caching_middleware.bytes_before_compression
+                / caching_middleware.bytes_after_compression,
+                2
+            ) if caching_middleware.bytes_after_compression else None
+        },
+        "coalesced": caching_middleware.coalesced,
+        "evictions": caching_middleware.evictions,
+        "admissions_rejected": caching_middleware.admissions_rejected,
+        "sketch_resets": caching_middleware.sketch.resets
     }
     
+    negative_cache_stats = {
+        "hits": negative_cache.hits,
+        "entries": len(negative_cache.entries),
+        "ttl": negative_cache.ttl
+    }
+
+    semantic_cache_stats = {
+        "hits": semantic_cache.hits,
+        "misses": semantic_cache.misses,
+        "entries": len(semantic_cache.entries),
+        "threshold": semantic_cache.threshold
+    }
+
     rate_limit_stats = {
         "max_requests_per_minute": rate_limiting_middleware.max_requests_per_minute,
         "active_clients": len(rate_limiting_middleware.client_requests)
@@ -930,13 +1975,16 @@ async def get_performance_stats() -> dict[str, Any]:
     
     error_stats = {
         "total_errors": sum(error_handling_middleware.error_counts.values()),
-        "errors_by_type": dict(error_handling_middleware.error_counts)
+        "errors_by_type": dict(error_handling_middleware.error_counts),
+        "deadlines_exceeded": deadline_middleware.deadlines_exceeded
     }
 
     return {
         "timestamp": datetime.now().isoformat(),
         "timing": timing_stats,
         "cache": cache_stats,
+        "semantic_cache": semantic_cache_stats,
+        "negative_cache": negative_cache_stats,
         "rate_limiting": rate_limit_stats,
         "errors": error_stats
     }
@@ -946,10 +1994,9 @@ async def get_performance_stats() -> dict[str, Any]:
 async def clear_cache() -> dict[str, Any]:
     """Clear the server cache."""
     # Access global caching middleware reference
-    cache_size = len(caching_middleware.cache)
-    caching_middleware.cache.clear()
-    caching_middleware.hits = 0
-    caching_middleware.misses = 0
+    cache_size = caching_middleware.clear()
+    semantic_cache.clear()
+    negative_cache.clear()
     
     return {
         "status": "success",
@@ -958,6 +2005,90 @@ async def clear_cache() -> dict[str, Any]:
     }
 
 
+# ========================================
+# Batch Execution
+# ========================================
+
+def _tool_result_payload(result: Any) -> Any:
+    """Plain JSON payload of a ToolResult: structured content, else text."""
+    structured = getattr(result, "structured_content", None)
+    if structured is not None:
+        return structured
+    texts = [
+        block.text for block in getattr(result, "content", []) if hasattr(block, "text")
+    ]
+    return texts[0] if len(texts) == 1 else texts
+
+
+@mcp.tool()
+async def batch(
+    calls: list[dict[str, Any]],
+    ctx: Context = None
+) -> dict[str, Any]:
+    """
+    Execute many independent tool calls concurrently in one request.
+
+    Each call is {"tool": "<name>", "arguments": {...}}. Calls go through
+    the middleware stack like any other tool call: each one counts against
+    the rate limit, and identical calls share the result cache and
+    single-flight. They are bounded by UPSTREAM_CONCURRENCY and by this
+    request's deadline. Results come back in input order; a failing call
+    is reported in place and does not affect the others.
+    """
+    if len(calls) > MAX_BATCH_SIZE:
+        raise McpError(
+            ErrorData(
+                code=-32602,
+                message=f"Batch too large: {len(calls)} calls (max {MAX_BATCH_SIZE})"
+            )
+        )
+
+    if ctx:
+        await ctx.info(f"📦 Executing batch of {len(calls)} tool calls")
+
+    available = await mcp.get_tools()
+    total = len(calls)
+    completed = 0
+
+    async def run(call: dict[str, Any]) -> Any:
+        nonlocal completed
+        tool_name = call.get("tool")
+        try:
+            if not isinstance(tool_name, str) or tool_name not in available:
+                raise ValueError(f"Unknown tool: {tool_name!r}")
+            if tool_name == "batch":
+                raise ValueError("Nested batch calls are not allowed")
+            result = await mcp._call_tool(tool_name, call.get("arguments") or {})
+            return _tool_result_payload(result)
+        finally:
+            completed += 1
+            if ctx:
+                await ctx.report_progress(
+                    completed, total, f"Completed {completed}/{total} calls"
+                )
+
+    outcomes = await _fan_out([lambda call=call: run(call) for call in calls])
+
+    results = []
+    for call, outcome in zip(calls, outcomes, strict=True):
+        if isinstance(outcome, Exception):
+            outcome = _unwrap_tool_error(outcome)
+            message = (
+                outcome.error.message if isinstance(outcome, McpError) else str(outcome)
+            )
+            results.append({"tool": call.get("tool"), "ok": False, "error": message})
+        else:
+            results.append({"tool": call.get("tool"), "ok": True, "result": outcome})
+
+    return {
+        "total": total,
+        "successful": sum(1 for r in results if r["ok"]),
+        "failed": sum(1 for r in results if not r["ok"]),
+        "results": results,
+        "timestamp": datetime.now().isoformat()
+    }
+
+
 if __name__ == "__main__":
     logger.info("="* 60)
     logger.info("🚀 R2R Ultra MCP Server v3.0")
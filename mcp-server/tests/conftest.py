@@ -6,8 +6,9 @@ from pathlib import Path
 
 import pytest
 
-# Add parent directory to path for imports
+# Add parent directory (and the layered examples) to path for imports
 sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(1, str(Path(__file__).parent.parent / "examples"))
 
 
 @pytest.fixture
@@ -41,3 +41,16 @@ def test_server_instructions():
     assert "tools" in instructions.lower()
     assert "features" in instructions.lower()
 
+
+
+def test_semantic_cache_settings_are_shared():
+    """Test that server and Layer 2 caches use retrieval.py's settings."""
+    import layer2_smart
+
+    import retrieval
+    from server import semantic_cache
+
+    for cache in (semantic_cache, layer2_smart._answer_cache):
+        assert cache.threshold == retrieval.SEMANTIC_CACHE_THRESHOLD
+        assert cache.ttl == retrieval.SEMANTIC_CACHE_TTL
+        assert cache.max_entries == retrieval.SEMANTIC_CACHE_SIZE
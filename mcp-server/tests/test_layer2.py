@@ -0,0 +1,537 @@
+"""
+Unit tests for the Layer 2 smart tools.
+"""
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+
+
+@pytest.fixture
+def layer2(monkeypatch):
+    """Layer 2 module with an in-memory checkpoint store."""
+    import layer2_smart
+
+    monkeypatch.setattr(
+        layer2_smart, "_checkpoint_store", layer2_smart.CheckpointStore(":memory:")
+    )
+    return layer2_smart
+
+
+@pytest.fixture
+def fake_r2r(monkeypatch):
+    """Serve Layer 1 HTTP calls from a handler instead of a live R2R."""
+    import layer1_openapi
+
+    real_client = httpx.AsyncClient
+
+    def install(handler):
+        monkeypatch.setattr(
+            layer1_openapi.httpx, "AsyncClient",
+            lambda **kwargs: real_client(
+                transport=httpx.MockTransport(handler), **kwargs
+            )
+        )
+
+    return install
+
+
+@pytest.fixture
+def ingest_root(tmp_path, monkeypatch):
+    """Temporary directory that Layer 1 accepts uploads from."""
+    import layer1_openapi
+
+    root = (tmp_path / "ingest").resolve()
+    root.mkdir()
+    monkeypatch.setattr(layer1_openapi, "INGEST_ROOT", root)
+    return root
+
+
+def test_parse_tags_reads_json_and_line_formats(layer2):
+    """Test that tags parse from a JSON object or "category: tags" lines."""
+    answer = 'Tags: {"topic": ["ml", " ai "], "language": "en, fr"}'
+    assert layer2._parse_tags(answer, ["topic", "language"]) == {
+        "topic": ["ml", "ai"],
+        "language": ["en", "fr"],
+    }
+
+    answer = "- **Topic**: search, ranking\n- Audience: engineers"
+    assert layer2._parse_tags(answer, ["topic", "audience", "missing"]) == {
+        "topic": ["search", "ranking"],
+        "audience": ["engineers"],
+        "missing": [],
+    }
+
+
+def test_query_variants_split_compound_queries(layer2):
+    """Test that compound queries expand into keyword and clause variants."""
+    query = "What is RAG and how do vector databases work?"
+    variants = layer2._query_variants(query)
+
+    assert variants[0] == query
+    assert "rag vector databases work" in variants
+    assert "how do vector databases work?" in variants
+    assert layer2._query_variants("kubernetes") == ["kubernetes"]
+    assert len(layer2._query_variants(query, max_variants=2)) == 2
+
+
+def test_reciprocal_rank_fusion_rewards_agreement_and_dedupes_text(layer2):
+    """Test that RRF ranks shared chunks first and collapses identical text."""
+    first = [
+        {"id": "a", "text": "Alpha", "score": 0.9},
+        {"id": "b", "text": "Beta", "score": 0.8},
+    ]
+    second = [
+        {"id": "b", "text": "Beta", "score": 0.85},
+        {"id": "d", "text": "Delta", "score": 0.5},
+        {"id": "c", "text": "  alpha ", "score": 0.95},
+    ]
+
+    fused = layer2._reciprocal_rank_fusion([first, second], k=60)
+
+    assert [c["id"] for c in fused] == ["b", "c", "d"]
+    assert fused[0]["matched_queries"] == [0, 1]
+    assert fused[0]["rrf_score"] == pytest.approx(1 / 62 + 1 / 61)
+    # "a" and "c" share normalized text; the higher-scoring copy is kept
+    assert fused[1]["matched_queries"] == [0, 1]
+
+
+def test_cluster_chunks_groups_by_topic(layer2):
+    """Test that k-means clustering separates unrelated topics."""
+    chunks = [
+        {"id": "k1", "text": "kubernetes pods scheduling nodes"},
+        {"id": "k2", "text": "kubernetes pods autoscaling nodes"},
+        {"id": "p1", "text": "pasta sauce tomato basil"},
+        {"id": "p2", "text": "pasta tomato garlic basil"},
+    ]
+
+    labeled, clusters = layer2._cluster_chunks(chunks, num_clusters=2)
+
+    groups = sorted(sorted(c["chunk_ids"]) for c in clusters)
+    assert groups == [["k1", "k2"], ["p1", "p2"]]
+    assert all(len(c["label"]) <= layer2.CLUSTER_LABEL_TERMS for c in clusters)
+    assert labeled[0]["cluster"] == labeled[1]["cluster"] != labeled[2]["cluster"]
+    assert layer2._cluster_chunks([]) == ([], [])
+
+
+async def test_synthesize_sources_retrieves_once(layer2, monkeypatch):
+    """Test that repeated syntheses generate from one shared retrieval."""
+    searches = []
+    prompts = []
+
+    async def fake_search(query, limit, search_strategy="vanilla"):
+        searches.append(query)
+        return {"results": {"chunk_search_results": [
+            {"id": "c1", "document_id": "d1", "text": "RAG retrieves.", "score": 0.9},
+            {"id": "c2", "document_id": "d2", "text": "It generates.", "score": 0.8},
+        ]}}
+
+    async def fake_completion(messages, max_tokens):
+        prompts.append(messages[0]["content"])
+        return {"results": {"choices": [{"message": {"content": "It works [1][2]"}}]}}
+
+    monkeypatch.setattr(layer2.layer1, "r2r_search", fake_search)
+    monkeypatch.setattr(layer2.layer1, "r2r_completion", fake_completion)
+
+    query = "how does retrieval work"
+    result = await layer2.synthesize_sources.fn(query, num_sources=2)
+    await layer2.synthesize_sources.fn(query, num_sources=2)
+
+    assert searches == [query]
+    assert "[1] RAG retrieves.\n\n[2] It generates." in prompts[0]
+    assert result["synthesized_answer"] == "It works [1][2]"
+    assert [c["chunk_id"] for c in result["citations"]] == ["c1", "c2"]
+
+
+async def test_synthesize_sources_packs_chunks_into_budget(layer2, monkeypatch):
+    """Test that only chunks fitting the context budget reach generation."""
+    chunks = [
+        {"id": str(i), "text": "Sentence about retrieval. " * 100, "score": 1 - i / 10}
+        for i in range(5)
+    ]
+    prompts = []
+
+    async def fake_search(query, limit, search_strategy="vanilla"):
+        return {"results": {"chunk_search_results": chunks}}
+
+    async def fake_completion(messages, max_tokens):
+        prompts.append(messages[0]["content"])
+        return {"results": {"choices": [{"message": {"content": "answer"}}]}}
+
+    monkeypatch.setattr(layer2.layer1, "r2r_search", fake_search)
+    monkeypatch.setattr(layer2.layer1, "r2r_completion", fake_completion)
+
+    result = await layer2.synthesize_sources.fn(
+        "packing budget query", num_sources=5, context_budget=1000,
+        use_semantic_cache=False
+    )
+
+    assert result["sources_used"] == 2
+    assert result["context_tokens"] <= 1000
+    assert "[3]" not in prompts[0]
+
+
+async def test_track_ingestion_polls_in_batches_until_terminal(layer2, monkeypatch):
+    """Test that statuses are fetched in batches until every document ends."""
+    checks = {"a": ["pending", "success"], "b": ["failed"], "c": ["parsing"] * 10}
+    calls = []
+
+    async def fake_documents_list(limit, ids):
+        calls.append(sorted(ids))
+        return {"results": [
+            {"id": doc_id, "ingestion_status": checks[doc_id].pop(0)}
+            for doc_id in ids if checks[doc_id]
+        ]}
+
+    monkeypatch.setattr(layer2.layer1, "documents_list", fake_documents_list)
+    monkeypatch.setattr(layer2, "STATUS_INITIAL_DELAY", 0.01)
+    completed = []
+
+    statuses = await layer2._track_ingestion(
+        ["a", "b", "c"], timeout=0.2,
+        on_complete=lambda doc_id, status: completed.append((doc_id, status))
+    )
+
+    assert statuses == {"a": "success", "b": "failed", "c": "parsing"}
+    assert calls[0] == ["a", "b", "c"]
+    assert sorted(completed) == [("a", "success"), ("b", "failed")]
+
+
+async def test_map_bounded_resumes_from_checkpoint(layer2):
+    """Test that a re-run only processes items that did not complete."""
+    processed = []
+    failing = {"b"}
+
+    async def work(item):
+        processed.append(item)
+        if item in failing:
+            raise RuntimeError("temporary")
+        return item.upper()
+
+    first = await layer2._map_bounded(["a", "b", "c"], work, checkpoint="run")
+    assert isinstance(first[1], RuntimeError)
+
+    failing.clear()
+    processed.clear()
+    second = await layer2._map_bounded(["a", "b", "c"], work, checkpoint="run")
+
+    assert second == ["A", "B", "C"]
+    assert processed == ["b"]
+    assert layer2._checkpoint_store.load("run") == {}
+
+
+async def test_map_bounded_drops_checkpoint_after_permanent_errors(layer2):
+    """Test that runs whose failures cannot be retried leave no checkpoint."""
+    request = httpx.Request("GET", "http://r2r/v3/documents/missing")
+    not_found = httpx.HTTPStatusError(
+        "Not found", request=request, response=httpx.Response(404, request=request)
+    )
+
+    async def work(item):
+        if item == "missing":
+            raise not_found
+        return item
+
+    await layer2._map_bounded(["ok", "missing"], work, checkpoint="run")
+
+    assert layer2._checkpoint_store.load("run") == {}
+
+
+async def test_map_bounded_returns_finished_items_at_deadline(layer2):
+    """Test that items still running at the deadline are cancelled as timeouts."""
+    cancelled = []
+
+    async def work(item):
+        if item == "slow":
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(item)
+                raise
+        return item.upper()
+
+    outcomes = await layer2._map_bounded(["a", "slow", "c"], work, deadline=0.05)
+
+    assert outcomes[0] == "A" and outcomes[2] == "C"
+    assert isinstance(outcomes[1], asyncio.TimeoutError)
+    assert cancelled == ["slow"]
+    assert [layer2._outcome_status(o) for o in outcomes] == ["ok", "timeout", "ok"]
+
+
+def test_checkpoint_store_ignores_expired_runs(layer2):
+    """Test that checkpoints older than the TTL are not resumed."""
+    store = layer2.CheckpointStore(":memory:", ttl=0.0)
+    store.add("run", "a", {"done": True})
+    store.flush()
+
+    assert store.load("run") == {}
+
+
+async def test_smart_search_reaches_r2r_through_layer1(layer2, fake_r2r):
+    """Test that Layer 2 calls the real Layer 1 wrappers end to end."""
+    searched = []
+
+    def handler(request):
+        body = json.loads(request.content)
+        searched.append(body["query"])
+        return httpx.Response(200, json={"results": {"chunk_search_results": [
+            {"id": "c1", "text": "Layer one answers.", "score": 0.9},
+        ]}})
+
+    fake_r2r(handler)
+
+    result = await layer2.smart_search.fn(
+        "layer one end to end", expand_query=False, cluster_results=False
+    )
+
+    assert searched == ["layer one end to end"]
+    assert [r["id"] for r in result["results"]] == ["c1"]
+
+
+async def test_knowledge_graph_query_fetches_every_component(layer2, fake_r2r):
+    """Test that all graph components are fetched from R2R."""
+    def handler(request):
+        component = request.url.path.rsplit("/", 1)[-1]
+        return httpx.Response(200, json={"results": [{"name": component}]})
+
+    fake_r2r(handler)
+
+    result = await layer2.knowledge_graph_query.fn("collection-1")
+
+    assert result["status"] == "completed"
+    assert result["errors"] == {}
+    assert result["relationships"] == [{"name": "relationships"}]
+
+
+async def test_comparative_analysis_returns_partial_results(layer2, fake_r2r):
+    """Test that failed and slow topics do not sink the comparison."""
+    async def handler(request):
+        query = json.loads(request.content)["query"]
+        if query.endswith("broken"):
+            return httpx.Response(500, json={"detail": "boom"})
+        if query.endswith("slow"):
+            await asyncio.sleep(1)
+        return httpx.Response(
+            200, json={"results": {"generated_answer": f"About {query}"}}
+        )
+
+    fake_r2r(handler)
+
+    result = await layer2.comparative_analysis.fn(
+        ["alpha", "broken", "slow"], topic_timeout=0.1
+    )
+
+    assert result["topic_status"] == {
+        "alpha": "ok", "broken": "error", "slow": "timeout"
+    }
+    assert list(result["individual_analyses"]) == ["alpha"]
+    assert set(result["failed_topics"]) == {"broken", "slow"}
+    assert result["comparison"].startswith("About Compare and contrast")
+
+
+async def test_upload_streams_multipart_with_exact_length(
+    layer2, fake_r2r, ingest_root, monkeypatch
+):
+    """Test that uploads stream a well-formed multipart body."""
+    content = b"0123456789" * 10
+    (ingest_root / "notes.txt").write_bytes(content)
+    monkeypatch.setattr(layer2.layer1, "UPLOAD_CHUNK_SIZE", 16)
+    seen = {}
+
+    async def handler(request):
+        seen["body"] = b"".join([chunk async for chunk in request.stream])
+        seen["headers"] = request.headers
+        return httpx.Response(200, json={"results": {"document_id": "doc-1"}})
+
+    fake_r2r(handler)
+    chunks = []
+
+    response = await layer2.layer1.upload_document_file(
+        "notes.txt", fields={"metadata": {"k": "v"}}, on_chunk=chunks.append
+    )
+
+    body = seen["body"]
+    boundary = seen["headers"]["content-type"].split("boundary=")[1]
+    assert response["results"]["document_id"] == "doc-1"
+    assert int(seen["headers"]["content-length"]) == len(body)
+    assert chunks == [16] * 6 + [4]
+    assert b'name="metadata"\r\n\r\n{"k": "v"}\r\n' in body
+    assert b'filename="notes.txt"' in body
+    assert b"\r\n\r\n" + content + f"\r\n--{boundary}--\r\n".encode() in body
+
+
+async def test_uploads_are_confined_to_ingest_root(layer2, ingest_root, tmp_path):
+    """Test that paths resolving outside INGEST_ROOT are refused."""
+    docs = ingest_root / "docs"
+    docs.mkdir()
+    (docs / "inside.txt").write_text("inside")
+    secret = tmp_path / "secret.txt"
+    secret.write_text("secret")
+    (docs / "escape.txt").symlink_to(secret)
+
+    with pytest.raises(ValueError, match="outside INGEST_ROOT"):
+        await layer2.layer1.documents_create(str(secret))
+    with pytest.raises(ValueError, match="outside INGEST_ROOT"):
+        await layer2.document_upload_pipeline.fn("../")
+    assert layer2._discover_files(Path("docs"), True, "*") == [docs / "inside.txt"]
+
+
+async def test_ingest_reports_files_removed_after_discovery(
+    layer2, fake_r2r, ingest_root
+):
+    """Test that a file vanishing mid-run fails alone."""
+    kept = ingest_root / "kept.txt"
+    kept.write_text("kept")
+    fake_r2r(lambda request: httpx.Response(
+        200, json={"results": {"document_id": "doc-1"}}
+    ))
+
+    results = await layer2._ingest_files([kept, ingest_root / "gone.txt"])
+
+    statuses = {Path(r["file_path"]).name: r["status"] for r in results}
+    assert statuses == {"kept.txt": "uploaded", "gone.txt": "failed"}
+
+
+async def test_ingest_index_skips_unchanged_and_replaces_changed_files(
+    layer2, fake_r2r, ingest_root
+):
+    """Test that re-runs skip unchanged files and replace edited ones."""
+    path = ingest_root / "notes.txt"
+    path.write_text("first version")
+    index = layer2.IngestIndex(":memory:")
+    requests = []
+
+    def handler(request):
+        requests.append((request.method, request.url.path))
+        document_id = f"doc-{len(requests)}"
+        return httpx.Response(200, json={"results": {"document_id": document_id}})
+
+    fake_r2r(handler)
+
+    async def ingest():
+        results = await layer2._ingest_files([path], index=index)
+        return [(r["status"], r.get("document_id")) for r in results]
+
+    assert await ingest() == [("uploaded", "doc-1")]
+    assert await ingest() == [("unchanged", "doc-1")]
+
+    # Same content under a new mtime is recognized by its hash
+    os.utime(path, ns=(0, 0))
+    assert await ingest() == [("unchanged", "doc-1")]
+    assert len(requests) == 1
+
+    path.write_text("second version")
+    assert await ingest() == [("updated", "doc-2")]
+    assert requests[1:] == [
+        ("POST", "/v3/documents"), ("DELETE", "/v3/documents/doc-1")
+    ]
+    assert await ingest() == [("unchanged", "doc-2")]
+
+
+async def _wait_until(condition, timeout=5.0):
+    """Poll condition until it holds or the timeout expires."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached in time"
+        await asyncio.sleep(0.01)
+
+
+async def test_polling_watcher_syncs_changes_and_survives_failed_batches(
+    layer2, fake_r2r, ingest_root, monkeypatch
+):
+    """Test that the polling watcher pushes deltas and outlives a bad batch."""
+    monkeypatch.setattr(layer2, "_ingest_index", layer2.IngestIndex(":memory:"))
+    (ingest_root / "a.txt").write_text("a")
+    uploads = []
+    deletes = []
+
+    def handler(request):
+        if request.method == "DELETE":
+            deletes.append(request.url.path.rsplit("/", 1)[-1])
+            return httpx.Response(200, json={"results": {}})
+        uploads.append(f"doc-{len(uploads) + 1}")
+        return httpx.Response(200, json={"results": {"document_id": uploads[-1]}})
+
+    fake_r2r(handler)
+    real_ingest = layer2._ingest_files
+    failures = ["index is locked"]
+
+    async def flaky_ingest(*args, **kwargs):
+        if failures:
+            raise RuntimeError(failures.pop())
+        return await real_ingest(*args, **kwargs)
+
+    with pytest.raises(ValueError, match="outside INGEST_ROOT"):
+        await layer2.watch_folder_start.fn("..", use_native=False)
+    described = await layer2.watch_folder_start.fn(
+        ".", use_native=False, poll_interval=0.02, debounce=0.05
+    )
+    watcher = layer2._watchers[described["watch_id"]]
+    try:
+        await _wait_until(lambda: watcher.stats["files_ingested"] == 1)
+
+        monkeypatch.setattr(layer2, "_ingest_files", flaky_ingest)
+        (ingest_root / "b.txt").write_text("b")
+        await _wait_until(lambda: watcher.stats["errors"] == 1)
+        assert watcher.stats["last_error"] == "index is locked"
+
+        (ingest_root / "c.txt").write_text("c")
+        (ingest_root / "a.txt").unlink()
+        await _wait_until(lambda: deletes == ["doc-1"])
+        await _wait_until(lambda: watcher.stats["files_ingested"] == 2)
+        assert watcher.describe()["running"] is True
+    finally:
+        await layer2.watch_folder_stop.fn(watcher.id)
+
+
+async def test_job_manager_cancels_queued_and_running_jobs(layer2):
+    """Test that cancellation works whether a job has started or not."""
+    manager = layer2.JobManager(workers=1, ttl=60)
+    started = asyncio.Event()
+
+    async def slow_tool(seconds, ctx):
+        started.set()
+        await asyncio.sleep(seconds)
+        return "done"
+
+    running = manager.submit("slow_tool", slow_tool, {"seconds": 10})
+    queued = manager.submit("slow_tool", slow_tool, {"seconds": 10})
+    await started.wait()
+    assert (running.status, queued.status) == ("running", "queued")
+
+    manager.cancel(queued.id)
+    manager.cancel(running.id)
+    await asyncio.gather(running.task, queued.task)
+
+    assert (running.status, queued.status) == ("cancelled", "cancelled")
+    assert queued.started_at is None
+    assert running.describe()["finished_at"] is not None
+
+
+async def test_job_manager_purges_finished_jobs_after_ttl(layer2):
+    """Test that finished jobs expire while unfinished ones are kept."""
+    manager = layer2.JobManager(workers=2, ttl=0.05)
+    release = asyncio.Event()
+
+    async def quick_tool(ctx):
+        return "done"
+
+    async def blocked_tool(ctx):
+        await release.wait()
+
+    finished = manager.submit("quick_tool", quick_tool, {})
+    pending = manager.submit("blocked_tool", blocked_tool, {})
+    await finished.task
+    assert manager.get(finished.id).result == "done"
+
+    await asyncio.sleep(0.1)
+
+    with pytest.raises(ValueError, match="Unknown or expired"):
+        manager.get(finished.id)
+    assert [job.id for job in manager.list_jobs()] == [pending.id]
+    release.set()
+    await pending.task
@@ -1,8 +1,15 @@
 """
 Unit tests for middleware components.
 """
+import asyncio
+from unittest.mock import AsyncMock, Mock
+
+import anyio
+import pytest
+
 from server import (
     CachingMiddleware,
+    DeadlineMiddleware,
     ErrorHandlingMiddleware,
     LoggingMiddleware,
     RateLimitingMiddleware,
@@ -73,13 +80,273 @@ def test_middleware_count(mcp_server):
     """Test that all middleware are registered."""
     middleware_list = mcp_server._middleware
 
-    # Should have exactly 5 middleware components
-    assert len(middleware_list) == 5
+    # Should have exactly 6 middleware components
+    assert len(middleware_list) == 6
 
     # Verify order (FIFO)
     assert isinstance(middleware_list[0], LoggingMiddleware)
     assert isinstance(middleware_list[1], TimingMiddleware)
     assert isinstance(middleware_list[2], RateLimitingMiddleware)
-    assert isinstance(middleware_list[3], ErrorHandlingMiddleware)
-    assert isinstance(middleware_list[4], CachingMiddleware)
+    assert isinstance(middleware_list[3], DeadlineMiddleware)
+    assert isinstance(middleware_list[4], ErrorHandlingMiddleware)
+    assert isinstance(middleware_list[5], CachingMiddleware)
+
+
+async def test_error_handling_middleware_does_not_retry_cancellation():
+    """Test that a cancelled tool call propagates without retries."""
+    middleware = ErrorHandlingMiddleware(max_retries=2)
+    context = Mock()
+    context.message.name = "slow_tool"
+    call_next = AsyncMock(side_effect=asyncio.CancelledError())
+
+    with pytest.raises(asyncio.CancelledError):
+        await middleware.on_call_tool(context, call_next)
+
+    assert call_next.await_count == 1
+    assert middleware.error_counts["tool:slow_tool:Cancelled"] == 1
+
+
+async def test_error_handling_middleware_does_not_retry_client_disconnect():
+    """Test that a closed client stream is not retried."""
+    middleware = ErrorHandlingMiddleware(max_retries=2)
+    context = Mock()
+    context.message.name = "slow_tool"
+    call_next = AsyncMock(side_effect=anyio.ClosedResourceError())
+
+    with pytest.raises(anyio.ClosedResourceError):
+        await middleware.on_call_tool(context, call_next)
+
+    assert call_next.await_count == 1
+
+
+async def test_error_handling_middleware_sees_client_disconnect_through_fastmcp():
+    """Test that a disconnect raised inside a real tool is not retried."""
+    from fastmcp import Client, FastMCP
+    from fastmcp.exceptions import ToolError
+
+    server = FastMCP("test")
+    middleware = ErrorHandlingMiddleware(max_retries=2)
+    server.add_middleware(middleware)
+    calls = []
+
+    @server.tool()
+    async def stream_tool() -> str:
+        calls.append(1)
+        raise anyio.ClosedResourceError()
+
+    async with Client(server) as client:
+        with pytest.raises(ToolError):
+            await client.call_tool("stream_tool", {})
+
+    assert len(calls) == 1
+    assert middleware.error_counts["tool:stream_tool:ClientGone"] == 1
+
+
+def test_deadline_middleware_initialization():
+    """Test DeadlineMiddleware initializes correctly."""
+    middleware = DeadlineMiddleware(default_budget=30.0)
+    assert middleware.default_budget == 30.0
+    assert middleware.deadlines_exceeded == 0
+
+
+async def test_deadline_middleware_bounds_upstream_timeouts():
+    """Test that upstream timeouts inherit the remaining tool budget."""
+    from server import _request_timeout
+
+    middleware = DeadlineMiddleware(default_budget=20.0)
+    context = Mock()
+    context.message.name = "rag_tool"
+    seen = {}
+
+    async def call_next(_context):
+        seen["search"] = _request_timeout("/v3/retrieval/search")
+        seen["health"] = _request_timeout("/v3/health")
+        return "ok"
+
+    assert await middleware.on_call_tool(context, call_next) == "ok"
+    assert 19.0 < seen["search"] <= 20.0
+    assert seen["health"] == 10.0
+
+
+async def test_deadline_middleware_fails_fast_when_budget_too_small():
+    """Test that a request is refused when the budget cannot be met."""
+    from mcp import McpError
+
+    from server import _request_timeout
+
+    middleware = DeadlineMiddleware(default_budget=2.0)
+    context = Mock()
+    context.message.name = "rag_tool"
+
+    async def call_next(_context):
+        return _request_timeout("/v3/retrieval/rag")
+
+    with pytest.raises(McpError):
+        await middleware.on_call_tool(context, call_next)
+    assert middleware.deadlines_exceeded == 1
+
+
+async def test_deadline_middleware_cancels_overrunning_tool():
+    """Test that a tool still running at its deadline is cancelled."""
+    from mcp import McpError
+
+    middleware = DeadlineMiddleware(default_budget=0.05)
+    context = Mock()
+    context.message.name = "slow_tool"
+
+    async def call_next(_context):
+        await asyncio.sleep(10)
+
+    with pytest.raises(McpError, match="Deadline exceeded"):
+        await middleware.on_call_tool(context, call_next)
+    assert middleware.deadlines_exceeded == 1
+
+
+async def test_deadline_middleware_sees_tool_deadline_through_fastmcp():
+    """Test that a deadline raised inside a real tool is counted, not retried."""
+    from fastmcp import Client, FastMCP
+    from fastmcp.exceptions import ToolError
+
+    from server import _request_timeout
+
+    server = FastMCP("test")
+    deadline = DeadlineMiddleware(default_budget=2.0)
+    errors = ErrorHandlingMiddleware(max_retries=2)
+    server.add_middleware(deadline)
+    server.add_middleware(errors)
+    calls = []
+
+    @server.tool()
+    async def rag_tool() -> float:
+        calls.append(1)
+        return _request_timeout("/v3/retrieval/rag")
+
+    async with Client(server) as client:
+        with pytest.raises(ToolError, match="Deadline exceeded"):
+            await client.call_tool("rag_tool", {})
+
+    assert len(calls) == 1
+    assert deadline.deadlines_exceeded == 1
+    assert errors.error_counts["tool:rag_tool:DeadlineExceeded"] == 1
+
+
+async def test_caching_middleware_coalesces_identical_calls():
+    """Test that identical concurrent calls share one execution."""
+    middleware = CachingMiddleware(ttl=60)
+    context = Mock()
+    context.method = "tools/call"
+    context.message.name = "search_tool"
+    context.message.arguments = {"query": "test"}
+    executions = 0
+
+    async def call_next(_context):
+        nonlocal executions
+        executions += 1
+        await asyncio.sleep(0.05)
+        return "result"
+
+    results = await asyncio.gather(
+        *[middleware.on_call_tool(context, call_next) for _ in range(3)]
+    )
+
+    assert results == ["result"] * 3
+    assert executions == 1
+    assert middleware.coalesced == 2
+
+
+async def test_caching_middleware_skips_uncacheable_tools():
+    """Test that live-state tools are never served from the cache."""
+    middleware = CachingMiddleware(ttl=60)
+    context = Mock()
+    context.method = "tools/call"
+    context.message.name = "get_performance_stats"
+    context.message.arguments = {}
+    call_next = AsyncMock(return_value="stats")
+
+    await middleware.on_call_tool(context, call_next)
+    await middleware.on_call_tool(context, call_next)
+
+    assert call_next.await_count == 2
+    assert middleware.cache == {}
+
+    context.method = "resources/read"
+    context.message.uri = "r2r://server/stats"
+    await middleware.on_read_resource(context, call_next)
+    await middleware.on_read_resource(context, call_next)
+
+    assert call_next.await_count == 4
+    assert middleware.cache == {}
+
+
+async def test_caching_middleware_admission_protects_hot_entries():
+    """Test that one-off calls cannot evict a frequently used entry."""
+    middleware = CachingMiddleware(ttl=60, max_entries=2)
+
+    def context_for(name):
+        context = Mock()
+        context.method = "tools/call"
+        context.message.name = name
+        context.message.arguments = {}
+        return context
+
+    call_next = AsyncMock(return_value="result")
+    for _ in range(3):
+        await middleware.on_call_tool(context_for("hot_a"), call_next)
+        await middleware.on_call_tool(context_for("hot_b"), call_next)
+
+    for i in range(5):
+        await middleware.on_call_tool(context_for(f"one_off_{i}"), call_next)
+
+    cached_tools = [key.split(":")[1] for key in middleware.cache]
+    assert sorted(cached_tools) == ["hot_a", "hot_b"]
+    assert middleware.admissions_rejected == 5
+
+
+async def test_caching_middleware_rejects_before_encoding():
+    """Test that rejected candidates are not serialized or compressed."""
+    middleware = CachingMiddleware(ttl=60, max_entries=1)
+    encode = Mock(wraps=middleware._encode)
+    middleware._encode = encode
+    context = Mock()
+    context.method = "tools/call"
+    context.message.arguments = {}
+    call_next = AsyncMock(return_value="result")
+
+    context.message.name = "hot"
+    for _ in range(3):
+        await middleware.on_call_tool(context, call_next)
+    context.message.name = "one_off"
+    await middleware.on_call_tool(context, call_next)
+
+    assert encode.call_count == 1
+    assert middleware.admissions_rejected == 1
+
+
+async def test_caching_middleware_compresses_large_results():
+    """Test that large results are stored compressed and restored on hit."""
+    middleware = CachingMiddleware(ttl=60, compress_threshold=1024)
+    context = Mock()
+    context.method = "tools/call"
+    context.message.name = "rag_tool"
+    context.message.arguments = {"query": "large"}
+    large_result = {"answer": "repeated text " * 1000}
+    call_next = AsyncMock(return_value=large_result)
+
+    await middleware.on_call_tool(context, call_next)
+    cached = await middleware.on_call_tool(context, call_next)
+
+    assert cached == large_result
+    assert call_next.await_count == 1
+    assert middleware.compressed_entries == 1
+    assert middleware.total_bytes < len("repeated text " * 1000)
+    assert middleware.bytes_before_compression > middleware.bytes_after_compression
+
+    # Compression totals follow the stored entries
+    middleware._drop(next(iter(middleware.cache)))
+    assert middleware.bytes_before_compression == 0
+    assert middleware.bytes_after_compression == 0
+    assert middleware.compressed_entries == 0
 
+    await middleware.on_call_tool(context, call_next)
+    assert middleware.clear() == 1
+    assert middleware.total_bytes == 0
@@ -1,6 +1,11 @@
 """
 Unit tests for R2R Ultra MCP Server.
 """
+import asyncio
+import contextlib
+
+import httpx
+import pytest
 
 
 def test_server_initialization(mcp_server):
@@ -55,7 +60,7 @@ def test_server_has_middleware(mcp_server):
     """Test that server has middleware configured."""
     assert hasattr(mcp_server, '_middleware')
     middleware = mcp_server._middleware
-    assert len(middleware) == 5  # 5 middleware components
+    assert len(middleware) == 6  # 6 middleware components
 
     middleware_classes = [m.__class__.__name__ for m in middleware]
 
@@ -63,5 +68,395 @@ def test_server_has_middleware(mcp_server):
     assert "LoggingMiddleware" in middleware_classes
     assert "TimingMiddleware" in middleware_classes
     assert "RateLimitingMiddleware" in middleware_classes
+    assert "DeadlineMiddleware" in middleware_classes
     assert "ErrorHandlingMiddleware" in middleware_classes
     assert "CachingMiddleware" in middleware_classes
+
+
+async def test_fan_out_returns_results_in_order_with_errors():
+    """Test that _fan_out keeps order and returns failures in place."""
+    from server import _fan_out
+
+    async def ok(value):
+        return value
+
+    async def fail():
+        raise ValueError("boom")
+
+    results = await _fan_out([lambda: ok(1), fail, lambda: ok(3)])
+
+    assert results[0] == 1
+    assert isinstance(results[1], ValueError)
+    assert results[2] == 3
+
+
+async def test_fan_out_cancellation_cancels_all_calls():
+    """Test that cancelling the caller cancels every outstanding call."""
+    from server import _fan_out
+
+    cancelled = 0
+
+    async def slow():
+        nonlocal cancelled
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled += 1
+            raise
+
+    task = asyncio.create_task(_fan_out([slow, slow, slow]))
+    await asyncio.sleep(0.05)
+    task.cancel()
+
+    with contextlib.suppress(asyncio.CancelledError):
+        await task
+
+    assert cancelled == 3
+
+
+async def test_fan_out_returns_finished_calls_at_deadline():
+    """Test that calls still running at the deadline come back as timeouts."""
+    from server import _fan_out
+
+    async def ok(value):
+        return value
+
+    async def slow():
+        await asyncio.sleep(10)
+
+    results = await _fan_out([lambda: ok(1), slow, lambda: ok(3)], deadline=0.05)
+
+    assert results[0] == 1
+    assert isinstance(results[1], asyncio.TimeoutError)
+    assert results[2] == 3
+
+
+async def test_fan_out_stops_inside_the_tool_deadline():
+    """Test that the default fan-out deadline leaves margin before the tool's."""
+    import server
+
+    async def slow():
+        await asyncio.sleep(10)
+
+    token = server._deadline.set(
+        server.time.monotonic() + server.FAN_OUT_MARGIN + 0.05
+    )
+    try:
+        started = server.time.monotonic()
+        results = await server._fan_out([slow])
+    finally:
+        server._deadline.reset(token)
+
+    assert isinstance(results[0], asyncio.TimeoutError)
+    assert server.time.monotonic() - started < 1.0
+
+
+async def test_batch_returns_results_in_order_with_errors(monkeypatch):
+    """Test that batch runs every call and reports failures in place."""
+    import server
+
+    class FakeResult:
+        def __init__(self, value):
+            self.structured_content = value
+
+    async def fake_get_tools():
+        return dict.fromkeys(("smart_collection_search", "batch"))
+
+    async def fake_call_tool(name, arguments):
+        if arguments.get("fail"):
+            raise ValueError("boom")
+        return FakeResult({"tool": name, "arguments": arguments})
+
+    monkeypatch.setattr(server.mcp, "get_tools", fake_get_tools)
+    monkeypatch.setattr(server.mcp, "_call_tool", fake_call_tool)
+
+    result = await server.batch.fn(calls=[
+        {"tool": "smart_collection_search", "arguments": {"query": "a"}},
+        {"tool": "smart_collection_search", "arguments": {"fail": True}},
+        {"tool": "missing_tool"},
+        {"tool": "batch", "arguments": {"calls": []}},
+    ])
+
+    assert result["successful"] == 1
+    assert result["failed"] == 3
+    assert result["results"][0]["result"]["arguments"] == {"query": "a"}
+    assert result["results"][1]["error"] == "boom"
+    assert "Unknown tool" in result["results"][2]["error"]
+    assert "Nested" in result["results"][3]["error"]
+
+
+@pytest.fixture
+def fake_upstream(monkeypatch):
+    """Route server requests to a handler counting upstream calls."""
+    import server
+
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json={"results": {"chunk_search_results": []}})
+
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(
+        server.httpx, "AsyncClient",
+        lambda **kwargs: real_client(
+            transport=httpx.MockTransport(handler), **kwargs
+        )
+    )
+    return requests
+
+
+async def test_batch_charges_rate_limit_per_nested_call(fake_upstream, monkeypatch):
+    """Test that every call inside a batch counts against the rate limit."""
+    from fastmcp import Client
+
+    import server
+
+    limiter = server.rate_limiting_middleware
+    limiter.client_requests.clear()
+
+    def spent():
+        return sum(len(times) for times in limiter.client_requests.values())
+
+    calls = [{"tool": "get_performance_stats"} for _ in range(5)]
+    async with Client(server.mcp) as client:
+        await client.call_tool("get_performance_stats")
+        # Room for the batch request itself and two of its calls
+        monkeypatch.setattr(limiter, "max_requests_per_minute", spent() + 3)
+        result = await client.call_tool("batch", {"calls": calls})
+
+    outcome = result.structured_content
+    assert outcome["successful"] == 2
+    assert outcome["failed"] == 3
+    assert all(
+        "Rate limit exceeded" in r["error"] for r in outcome["results"] if not r["ok"]
+    )
+
+
+async def test_batch_calls_share_the_result_cache(fake_upstream):
+    """Test that identical calls in and out of a batch reach R2R only once."""
+    from fastmcp import Client
+
+    import server
+
+    server.caching_middleware.clear()
+    server.rate_limiting_middleware.client_requests.clear()
+    call = {"tool": "smart_collection_search", "arguments": {"query": "batched"}}
+
+    def searches():
+        return sum(r.url.path == "/v3/retrieval/search" for r in fake_upstream)
+
+    async with Client(server.mcp) as client:
+        result = await client.call_tool("batch", {"calls": [call, call, call]})
+        batched_searches = searches()
+        await client.call_tool(call["tool"], call["arguments"])
+
+    assert result.structured_content["successful"] == 3
+    assert batched_searches == 1
+    assert searches() == 1
+    server.caching_middleware.clear()
+
+
+def test_dedupe_near_duplicates_collapses_similar_chunks():
+    """Test that near-identical chunks are collapsed into the first copy."""
+    from server import _dedupe_near_duplicates
+
+    text = (
+        "The quick brown fox jumps over the lazy dog near the river bank "
+        "on a sunny afternoon in the summer while children play nearby. "
+        "Retrieval augmented generation combines a search index with a "
+        "language model so answers cite the source documents they came from."
+    )
+    chunks = [
+        {"id": "a", "text": text, "score": 0.9},
+        {
+            "id": "b",
+            "text": "Kubernetes schedules pods across nodes using resource requests.",
+            "score": 0.8
+        },
+        {"id": "c", "text": text.replace("sunny", "warm"), "score": 0.7},
+    ]
+
+    kept, removed = _dedupe_near_duplicates(chunks)
+
+    assert removed == 1
+    assert [c["id"] for c in kept] == ["a", "b"]
+    assert kept[0]["duplicate_ids"] == ["c"]
+    assert "duplicate_ids" not in chunks[0]
+
+
+def test_bm25_rerank_promotes_lexical_matches():
+    """Test that BM25 reranking lifts chunks containing the query terms."""
+    from server import _bm25_rerank
+
+    chunks = [
+        {"id": "a", "text": "General notes about deployment pipelines.", "score": 0.80},
+        {
+            "id": "b",
+            "text": "Kubernetes autoscaling adjusts kubernetes pod replicas.",
+            "score": 0.75
+        },
+        {"id": "c", "text": "Unrelated text about cooking pasta.", "score": 0.78},
+    ]
+
+    reranked = _bm25_rerank("kubernetes autoscaling", chunks, weight=0.5)
+
+    assert next(iter(reranked))["id"] == "b"
+    assert reranked[0]["bm25_score"] == 1.0
+    assert all("rerank_score" in c for c in reranked)
+    assert _bm25_rerank("query", []) == []
+
+
+def test_mmr_select_spreads_results_across_documents():
+    """Test that MMR selection prefers chunks from different documents."""
+    from server import _mmr_select
+
+    def chunk(chunk_id, text, score):
+        return {
+            "id": chunk_id, "document_id": chunk_id[0], "text": text, "score": score
+        }
+
+    chunks = [
+        chunk("a1", "Alpha document introduction text.", 0.95),
+        chunk("a2", "Alpha document second section.", 0.94),
+        chunk("a3", "Alpha document third section.", 0.93),
+        chunk("b1", "Beta covers a different subject.", 0.85),
+    ]
+
+    selected = _mmr_select(chunks, k=2, diversity=0.5)
+
+    assert [c["id"] for c in selected] == ["a1", "b1"]
+    assert [c["id"] for c in _mmr_select(chunks, k=2, diversity=0.0)] == ["a1", "a2"]
+    assert _mmr_select([], k=5) == []
+
+
+async def test_search_until_enough_stops_when_scores_fall(monkeypatch):
+    """Test that adaptive paging stops once results drop below min_score."""
+    import server
+
+    ranked = [{"id": str(i), "score": 1 - i * 0.05} for i in range(40)]
+    requested = []
+
+    async def fake_request(method, endpoint, data=None, ctx=None):
+        settings = data["search_settings"]
+        requested.append((settings["offset"], settings["limit"]))
+        page = ranked[settings["offset"]:settings["offset"] + settings["limit"]]
+        return {"results": {"chunk_search_results": page}}
+
+    monkeypatch.setattr(server, "_make_r2r_request", fake_request)
+
+    # Plenty pass: one small page is enough
+    results, requests = await server._search_until_enough("q", {}, 0.5, 3, None)
+    assert requests == 1 and len(results) == 5
+
+    # High threshold: stop at the first page ending below min_score
+    requested.clear()
+    results, requests = await server._search_until_enough("q", {}, 0.52, 20, None)
+    assert requested == [(0, 5), (5, 10)]
+    assert requests == 2
+
+
+def test_pack_context_respects_budget_and_truncates():
+    """Test that context packing stays within budget, truncating long chunks."""
+    from retrieval import estimate_tokens, pack_context
+
+    long_text = "This sentence is about retrieval. " * 100
+    chunks = [
+        {"id": "a", "text": long_text},
+        {"id": "b", "text": "Short chunk about packing."},
+        {"id": "c", "text": long_text},
+    ]
+
+    packed, used = pack_context(chunks, budget=300, max_chunk_tokens=200)
+
+    assert used <= 300
+    assert used == sum(estimate_tokens(c["text"]) for c in packed)
+    assert [c["id"] for c in packed][:2] == ["a", "b"]
+    assert packed[0]["truncated"] and packed[0]["text"].endswith(".")
+    assert packed[1]["truncated"] is False
+
+
+def test_truncate_to_tokens_stays_within_budget():
+    """Test that truncation markers fit the budget and blank text is dropped."""
+    from retrieval import estimate_tokens, pack_context, truncate_to_tokens
+
+    assert truncate_to_tokens(" " * 4000, 512) == ""
+    assert estimate_tokens(truncate_to_tokens("word " * 1000, 512)) <= 512
+    assert estimate_tokens(truncate_to_tokens("x" * 4000, 512)) <= 512
+
+    packed, used = pack_context([{"text": " " * 4000}, {"text": "ok"}], budget=600)
+    assert [c["text"] for c in packed] == ["ok"] and used == 1
+
+
+def test_semantic_cache_matches_paraphrases_within_scope():
+    """Test that paraphrased queries hit the semantic cache only in scope."""
+    from retrieval import SemanticCache
+
+    cache = SemanticCache(threshold=0.7)
+    question = "What is retrieval augmented generation?"
+    cache.set(question, {"query": "q", "answer": 1}, scope="c1")
+
+    paraphrase = "what's retrieval-augmented generation"
+    assert cache.get(paraphrase, scope="c1")["answer"] == 1
+    assert cache.get(question, scope="c2") is None
+    assert cache.get("How do I configure kubernetes ingress?", scope="c1") is None
+    assert cache.hits == 1 and cache.misses == 2
+
+
+def test_semantic_cache_requires_matching_chunks():
+    """Test that shared chunks restrict matches but never relax them."""
+    from retrieval import SemanticCache
+
+    cache = SemanticCache(threshold=0.8)
+    cache.set("explain vector index tuning", {"query": "q"}, chunk_ids=["a", "b", "c"])
+
+    query = "explain the vector index tuning"
+    assert cache.get(query, chunk_ids=["a", "b", "c"]) is not None
+    assert cache.get(query, chunk_ids=["x", "y"]) is None
+    assert cache.get("vector index tuning explained", chunk_ids=["a", "b", "c"]) is None
+
+
+def test_semantic_cache_keeps_numbers_and_negations_apart():
+    """Test that queries differing in a number or polarity word never match."""
+    from retrieval import SemanticCache
+
+    cache = SemanticCache(threshold=0.7)
+    cache.set("What was the revenue in 2022?", {"query": "q", "year": 2022})
+    cache.set("How do I enable logging?", {"query": "q"}, chunk_ids=["a", "b"])
+
+    assert cache.get("what was revenue in 2022")["year"] == 2022
+    assert cache.get("What was the revenue in 2023?") is None
+    assert cache.get("How do I disable logging?", chunk_ids=["a", "b"]) is None
+    assert cache.get("How do I not enable logging?", chunk_ids=["a", "b"]) is None
+
+
+async def test_negative_cache_short_circuits_missing_ids(monkeypatch):
+    """Test that 404s are remembered until the negative entry expires."""
+    import server
+
+    upstream_calls = []
+
+    def handler(request):
+        upstream_calls.append((request.method, request.url.path))
+        return httpx.Response(404, json={"detail": "Not found"})
+
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(
+        server.httpx, "AsyncClient",
+        lambda **kwargs: real_client(transport=httpx.MockTransport(handler), **kwargs)
+    )
+    server.negative_cache.clear()
+
+    for _ in range(3):
+        with pytest.raises(httpx.HTTPStatusError) as exc_info:
+            await server._make_r2r_request("GET", "/v3/collections/missing")
+        assert exc_info.value.response.status_code == 404
+    assert len(upstream_calls) == 1
+    assert server.negative_cache.hits == 2
+
+    # Once the entry expires the id is looked up upstream again
+    monkeypatch.setattr(server.negative_cache, "ttl", 0.0)
+    server.negative_cache.add("/v3/collections/missing")
+    with pytest.raises(httpx.HTTPStatusError):
+        await server._make_r2r_request("GET", "/v3/collections/missing")
+    assert len(upstream_calls) == 2